@@ -25,21 +25,35 @@ SOFTWARE.
 
 
 # Import built-in libraries.
+import io
 import os
+import abc
+import re
 import sys
 import json
 import math
 import time
 import uvloop
+import bisect
 import random
+import sqlite3
+import resource
+import tempfile
+import subprocess
 import logging
 import asyncio
 import datetime
+import weakref
 import functools
+import collections
 import itertools
 import traceback
-from threading import Thread
-from typing import Any, List, Dict, Tuple
+import tracemalloc
+import multiprocessing
+import urllib.parse
+import concurrent.futures
+from threading import Thread, Lock
+from typing import Any, Callable, List, Dict, Tuple, NamedTuple
 
 # Import third-party libraries.
 import qrcode
@@ -75,6 +89,14 @@ try:
         'SPOTIFY': config('SPOTIFY_CLIENT_ID', cast=str)
     }
     PREFIX = config('COMMAND_PREFIX', default='vrn.', cast=str)
+    GUILD_STORAGE = config('GUILD_STORAGE', default='sqlite', cast=str)
+    YTDL_CACHE_FILE = config('YTDL_CACHE_FILE', default='', cast=str)
+    YTDL_WORKERS = config('YTDL_WORKERS', default=4, cast=int)
+    YTDL_EXECUTOR = config('YTDL_EXECUTOR', default='thread', cast=str)
+    MUSIC_AUDIO_MODE = config('MUSIC_AUDIO_MODE', default='opus', cast=str)
+    MAX_VOICE_SESSIONS = config('MAX_VOICE_SESSIONS', default=25, cast=int)
+    MAX_FFMPEG_PROCESSES = config('MAX_FFMPEG_PROCESSES', default=40, cast=int)
+    QUEUE_JOURNAL_DIR = config('QUEUE_JOURNAL_DIR', default='queues', cast=str)
 
 except UndefinedValueError:
     print('One or more secrets have been left undefined. Consider going through the README.md file for proper instructions on setting Veron1CA up.')
@@ -85,6 +107,41 @@ except UndefinedValueError:
 # Core dictionaries and constants.
 DATETIME_FORMAT_STR = "%d/%m/%Y | %H:%M:%S"
 REACTION_EMOJI = '☑️'
+SNIPE_TTL = 25
+SNIPE_BUFFER_SIZE = 10
+WEBHOOK_CACHE_SIZE = 256
+WEBHOOK_SEND_CONCURRENCY = 4
+QR_CODE_CACHE_SIZE = 512
+SPOTIFY_BATCH_SIZE = 50
+SPOTIFY_PREFETCH_PAGES = 2
+IMPORT_SEARCH_CONCURRENCY = 4
+IMPORT_WINDOW = 16
+IMPORT_PROGRESS_INTERVAL = 5
+STREAM_LOOKAHEAD = 2
+STREAM_URL_TTL = 60 * 60 * 4
+STREAM_EXPIRY_MARGIN = 60 * 5
+SEARCH_CACHE_SIZE = 4096
+SEARCH_CACHE_TTL = 60 * 60 * 24 * 7
+STREAM_CACHE_SIZE = 1024
+STREAM_CACHE_TTL = 60 * 60 * 2
+YTDL_CACHE_PERSIST_INTERVAL = 300
+YTDL_MAX_PENDING = 64
+IMPORT_EXTRACTION_PATIENCE = 120
+BENCHMARK_PROBE_INTERVAL = 0.01
+PREBUFFER_LEAD = 5
+PREBUFFER_FRAMES = 50
+LOOP_CACHE_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_VOLUME = 1.0 if MUSIC_AUDIO_MODE == 'opus' else 0.5
+VOICE_IDLE_TIMEOUT = 180
+VOICE_PRESSURE_IDLE_TIMEOUT = 30
+VOICE_PRESSURE_RATIO = 0.8
+VOICE_MIN_IDLE = 10
+VOICE_ADMISSION_TIMEOUT = 15
+VOICE_AUDIT_INTERVAL = 300
+VOICE_CONNECT_COMMANDS = ('join', 'summon', 'play', 'playrich')
+QUEUE_CHECKPOINT_INTERVAL = 10
+QUEUE_JOURNAL_COMPACT_MIN = 256
+QUEUE_JOURNAL_COMPACT_RATIO = 4
 
 ACCENT_COLOR: Dict[str, int] = {
     'PRIMARY': 3158326, 
@@ -94,6 +151,14 @@ LOCK_ROLES: Dict[str, str] = {
     'MODERATOR': 'BotMod', 
     'ADMIN': 'BotAdmin'
 }
+GUILD_DEFAULTS: Dict[str, Any] = {
+    'prefix': None,
+    'filter_profanity': False,
+    'greet_message': None,
+    'profanity_allow': [],
+    'profanity_deny': []
+}
+MAX_GUILD_FILTER_WORDS = 100
 
 
 # Store startup data.
@@ -106,12 +171,516 @@ startup_data: Dict[str, float] = {
 # Implementation of the logging module.
 logging.basicConfig(filename='bot.log', filemode='w', format='%(asctime)s | %(levelname)s | %(message)s')
 
+# Aho-Corasick profanity matcher, compiled once from a word list and matching whole words in a single pass.
+class ProfanityMatcher:
+    def __init__(self, words: List[str]):
+        self.words = sorted({word.lower() for word in words})
+        self.allowed = profanity.ALLOWED_CHARACTERS
+        self.max_combinations = max([1] + [sum(char not in self.allowed for char in word) for word in self.words])
+        self._lengths = [len(word) for word in self.words]
+
+        # Characters that may stand in for one another (a / @ / 4, s / $ / 5, ...) are folded into one
+        # symbol, so the automaton stays as small as the word list itself. Candidates are verified afterwards.
+        self._variants = [[set(profanity.CHARS_MAPPING.get(char, (char,))) for char in word] for word in self.words]
+        self._fold = self._build_fold_map(profanity.CHARS_MAPPING)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for index, word in enumerate(self.words):
+            state = 0
+            for char in word:
+                symbol = self._fold.get(char, char)
+                if symbol not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][symbol] = len(self._goto) - 1
+                state = self._goto[state][symbol]
+            self._output[state].append(index)
+
+        pending = list(self._goto[0].values())
+        while pending:
+            state = pending.pop(0)
+            for symbol, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and symbol not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(symbol, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+                pending.append(next_state)
+
+    @staticmethod
+    def _build_fold_map(chars_mapping: Dict[str, Tuple[str, ...]]) -> Dict[str, str]:
+        parents: Dict[str, str] = {}
+
+        def find(char: str) -> str:
+            while parents.setdefault(char, char) != char:
+                char = parents[char]
+            return char
+
+        for char, variants in chars_mapping.items():
+            for variant in variants:
+                parents[find(variant)] = find(char)
+
+        return {char: find(char) for char in parents}
+
+    def _step(self, state: int, symbol: str) -> int:
+        while state and symbol not in self._goto[state]:
+            state = self._fail[state]
+        return self._goto[state].get(symbol, 0)
+
+    def _verify(self, segment: str, index: int) -> bool:
+        return all(char in variants for char, variants in zip(segment, self._variants[index]))
+
+    def find(self, text: str):
+        text = text.lower()
+        length = len(text)
+        allowed = self.allowed
+        lengths = self._lengths
+
+        first = next((index for index, char in enumerate(text) if char in allowed), length)
+        if first >= length - 1:
+            return
+
+        # Yields the lowercased spans that matched, since one span can match several folded word list entries.
+        # Both the raw text (words joined by their separators) and the text with separators stripped
+        # (words joined directly) are fed through the automaton in the same pass over the text.
+        raw_state = joined_state = 0
+        token = -1
+        token_of: List[int] = []
+        joined: List[str] = []
+        joined_token: List[int] = []
+
+        for index, char in enumerate(text):
+            is_allowed = char in allowed
+            if is_allowed and (index == 0 or token_of[-1] == -1):
+                token += 1
+                # Like better_profanity, a trailing one-character word is never joined with the words before it.
+                max_span = 0 if index == length - 1 else self.max_combinations
+            token_of.append(token if is_allowed else -1)
+
+            symbol = self._fold.get(char, char)
+            raw_state = self._step(raw_state, symbol)
+            if not is_allowed:
+                continue
+
+            joined.append(char)
+            joined_token.append(token)
+            joined_state = self._step(joined_state, symbol)
+
+            if index + 1 < length and text[index + 1] in allowed:
+                continue
+
+            for word_index in self._output[raw_state]:
+                begin = index - lengths[word_index] + 1
+                if (
+                    token_of[begin] != -1
+                    and (begin == 0 or token_of[begin - 1] == -1)
+                    and token - token_of[begin] <= max_span
+                    and self._verify(text[begin:index + 1], word_index)
+                ):
+                    yield text[begin:index + 1]
+
+            for word_index in self._output[joined_state]:
+                begin = len(joined) - lengths[word_index]
+                if (
+                    (begin == 0 or joined_token[begin - 1] != joined_token[begin])
+                    and token - joined_token[begin] <= max_span
+                    and self._verify(''.join(joined[begin:]), word_index)
+                ):
+                    yield ''.join(joined[begin:])
+
+    def contains_profanity(self, text: str) -> bool:
+        return next(self.find(text), None) is not None
+
+    def memory_usage(self) -> int:
+        return (
+            sum(sys.getsizeof(edges) for edges in self._goto)
+            + sum(sys.getsizeof(output) for output in self._output)
+            + sum(sys.getsizeof(variants) + sum(map(sys.getsizeof, variants)) for variants in self._variants)
+            + sys.getsizeof(self._goto) + sys.getsizeof(self._fail) + sys.getsizeof(self._output)
+        )
+
+
+# Per-guild profanity filters, layering a small compiled matcher of each guild's own words over the shared one.
+class GuildProfanityFilters:
+    def __init__(self, base: ProfanityMatcher):
+        self.base = base
+        self.rebuilds = 0
+
+        self._deltas: Dict[int, Tuple[ProfanityMatcher | None, frozenset]] = {}
+
+    def _get_delta(self, guild: dict) -> Tuple[ProfanityMatcher | None, frozenset]:
+        delta = self._deltas.get(guild['id'])
+
+        if delta is None:
+            deny = guild.get('profanity_deny') or []
+            allow = guild.get('profanity_allow') or []
+
+            delta = self._deltas[guild['id']] = (ProfanityMatcher(deny) if deny else None, frozenset(allow))
+            self.rebuilds += 1
+
+        return delta
+
+    def invalidate(self, id: int) -> None:
+        self._deltas.pop(id, None)
+
+    def contains_profanity(self, guild: dict, text: str) -> bool:
+        deny, allow = self._get_delta(guild)
+
+        if any(span not in allow for span in self.base.find(text)):
+            return True
+
+        return deny is not None and deny.contains_profanity(text)
+
+    @staticmethod
+    def _delta_memory_usage(delta: Tuple[ProfanityMatcher | None, frozenset]) -> int:
+        deny, allow = delta
+        return (deny.memory_usage() if deny else 0) + sys.getsizeof(allow) + sum(map(sys.getsizeof, allow))
+
+    def memory_usage(self, guild: dict) -> int:
+        return self._delta_memory_usage(self._get_delta(guild))
+
+    def stats(self) -> Dict[str, Any]:
+        usages = [self._delta_memory_usage(delta) for delta in self._deltas.values()]
+
+        return {
+            'base_bytes': self.base.memory_usage(),
+            'compiled_guilds': len(usages),
+            'delta_bytes_total': sum(usages),
+            'delta_bytes_max': max(usages, default=0),
+            'rebuilds': self.rebuilds
+        }
+
+
 # Implementation of the profanity filter.
+with open('filtered.txt', encoding='utf-8') as filtered_words:
+    profanity_matcher = ProfanityMatcher([word.strip() for word in filtered_words if word.strip()])
+
+profanity_filters = GuildProfanityFilters(profanity_matcher)
+
 profanity.load_censor_words_from_file('filtered.txt')
 
+
+# Storage backends for the guild database.
+class GuildStorage(abc.ABC):
+    @abc.abstractmethod
+    def all(self) -> List[dict]:
+        ...
+
+    @abc.abstractmethod
+    def get(self, id: int) -> dict | None:
+        ...
+
+    @abc.abstractmethod
+    def upsert(self, guild: dict) -> None:
+        ...
+
+    def upsert_many(self, guilds: List[dict]) -> None:
+        for guild in guilds:
+            self.upsert(guild)
+
+    @abc.abstractmethod
+    def all_jails(self) -> List[Tuple[int, int, str, int]]:
+        ...
+
+    @abc.abstractmethod
+    def put_jail(self, guild_id: int, member_id: int, reason: str, jailer_id: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete_jail(self, guild_id: int, member_id: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    def all_freezes(self) -> List[Tuple[int, int, int]]:
+        ...
+
+    @abc.abstractmethod
+    def put_freeze(self, guild_id: int, channel_id: int, author_id: int) -> None:
+        ...
+
+    @abc.abstractmethod
+    def delete_freeze(self, guild_id: int, channel_id: int) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+class TinyDBGuildStorage(GuildStorage):
+    def __init__(self, path: str):
+        self.db = TinyDB(path)
+        self._lock = Lock()
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            return [dict(guild) for guild in self.db.all()]
+
+    def get(self, id: int) -> dict | None:
+        with self._lock:
+            guild = self.db.get(Query().id == id)
+            return dict(guild) if guild else None
+
+    def upsert(self, guild: dict) -> None:
+        with self._lock:
+            self.db.upsert(guild, Query().id == guild['id'])
+
+    def all_jails(self) -> List[Tuple[int, int, str, int]]:
+        with self._lock:
+            return [(jail['guild_id'], jail['member_id'], jail['reason'], jail['jailer_id']) for jail in self.db.table('jails').all()]
+
+    def put_jail(self, guild_id: int, member_id: int, reason: str, jailer_id: int) -> None:
+        with self._lock:
+            self.db.table('jails').upsert(
+                {'guild_id': guild_id, 'member_id': member_id, 'reason': reason, 'jailer_id': jailer_id},
+                (Query().guild_id == guild_id) & (Query().member_id == member_id)
+            )
+
+    def delete_jail(self, guild_id: int, member_id: int) -> None:
+        with self._lock:
+            self.db.table('jails').remove((Query().guild_id == guild_id) & (Query().member_id == member_id))
+
+    def all_freezes(self) -> List[Tuple[int, int, int]]:
+        with self._lock:
+            return [(freeze['guild_id'], freeze['channel_id'], freeze['author_id']) for freeze in self.db.table('freezes').all()]
+
+    def put_freeze(self, guild_id: int, channel_id: int, author_id: int) -> None:
+        with self._lock:
+            self.db.table('freezes').upsert(
+                {'guild_id': guild_id, 'channel_id': channel_id, 'author_id': author_id},
+                (Query().guild_id == guild_id) & (Query().channel_id == channel_id)
+            )
+
+    def delete_freeze(self, guild_id: int, channel_id: int) -> None:
+        with self._lock:
+            self.db.table('freezes').remove((Query().guild_id == guild_id) & (Query().channel_id == channel_id))
+
+    def close(self) -> None:
+        self.db.close()
+
+class SQLiteGuildStorage(GuildStorage):
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = Lock()
+
+        with self._lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS guilds (id INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS jails (guild_id INTEGER, member_id INTEGER, reason TEXT, jailer_id INTEGER, PRIMARY KEY (guild_id, member_id))')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS freezes (guild_id INTEGER, channel_id INTEGER, author_id INTEGER, PRIMARY KEY (guild_id, channel_id))')
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            rows = self.connection.execute('SELECT data FROM guilds').fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, id: int) -> dict | None:
+        with self._lock:
+            row = self.connection.execute('SELECT data FROM guilds WHERE id = ?', (id,)).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def upsert(self, guild: dict) -> None:
+        with self._lock:
+            self.connection.execute(
+                'INSERT INTO guilds (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data',
+                (guild['id'], json.dumps(guild))
+            )
+
+    def upsert_many(self, guilds: List[dict]) -> None:
+        rows = [(guild['id'], json.dumps(guild)) for guild in guilds]
+
+        # The connection commits on the way out, or rolls back if anything failed, so no transaction is left open.
+        with self._lock, self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT INTO guilds (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data',
+                rows
+            )
+
+    def all_jails(self) -> List[Tuple[int, int, str, int]]:
+        with self._lock:
+            return self.connection.execute('SELECT guild_id, member_id, reason, jailer_id FROM jails').fetchall()
+
+    def put_jail(self, guild_id: int, member_id: int, reason: str, jailer_id: int) -> None:
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO jails VALUES (?, ?, ?, ?)', (guild_id, member_id, reason, jailer_id))
+
+    def delete_jail(self, guild_id: int, member_id: int) -> None:
+        with self._lock:
+            self.connection.execute('DELETE FROM jails WHERE guild_id = ? AND member_id = ?', (guild_id, member_id))
+
+    def all_freezes(self) -> List[Tuple[int, int, int]]:
+        with self._lock:
+            return self.connection.execute('SELECT guild_id, channel_id, author_id FROM freezes').fetchall()
+
+    def put_freeze(self, guild_id: int, channel_id: int, author_id: int) -> None:
+        with self._lock:
+            self.connection.execute('INSERT OR REPLACE INTO freezes VALUES (?, ?, ?)', (guild_id, channel_id, author_id))
+
+    def delete_freeze(self, guild_id: int, channel_id: int) -> None:
+        with self._lock:
+            self.connection.execute('DELETE FROM freezes WHERE guild_id = ? AND channel_id = ?', (guild_id, channel_id))
+
+    def migrate_from_tinydb(self, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+
+        with self._lock:
+            if self.connection.execute('SELECT 1 FROM guilds LIMIT 1').fetchone():
+                return 0
+
+            legacy_db = TinyDB(path)
+            guilds = legacy_db.all()
+            legacy_db.close()
+
+            with self.connection:
+                self.connection.execute('BEGIN')
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO guilds (id, data) VALUES (?, ?)',
+                    [(guild['id'], json.dumps(dict(guild))) for guild in guilds]
+                )
+
+        os.rename(path, f'{path}.migrated')
+        return len(guilds)
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+def open_guild_storage(backend: str) -> GuildStorage:
+    if backend == 'tinydb':
+        return TinyDBGuildStorage('guild-db.json')
+
+    storage = SQLiteGuildStorage('guild-db.sqlite3')
+    migrated = storage.migrate_from_tinydb('guild-db.json')
+
+    if migrated:
+        logging.warning(f'Migrated {migrated} guild(s) from guild-db.json to guild-db.sqlite3.')
+
+    return storage
+
+
+# In-memory cache of guild configurations, indexed by guild ID and kept in sync with the storage backend.
+class GuildConfigCache:
+    def __init__(self, storage: GuildStorage):
+        self.storage = storage
+        self.hits = 0
+        self.misses = 0
+        self.operations = 0
+
+        self._configs: Dict[int, dict] = {}
+        self._stored: set = set()
+
+    # The word lists are copied, so guilds never end up sharing one list object.
+    @staticmethod
+    def defaults(id: int) -> dict:
+        return {'id': id, **{key: list(value) if isinstance(value, list) else value for key, value in GUILD_DEFAULTS.items()}}
+
+    def load(self) -> None:
+        self._configs = {guild['id']: guild for guild in self.storage.all()}
+        self._stored = set(self._configs)
+        self.operations += 1
+
+    def get(self, id: int) -> dict:
+        guild = self._configs.get(id)
+
+        if guild is None:
+            self.misses += 1
+            guild = self._configs[id] = self.defaults(id)
+        else:
+            self.hits += 1
+
+        return guild
+
+    def ensure(self, ids: List[int]) -> None:
+        missing = [self._configs.setdefault(id, self.defaults(id)) for id in ids if id not in self._stored]
+
+        if missing:
+            self.storage.upsert_many(missing)
+            self._stored.update(guild['id'] for guild in missing)
+            self.operations += 1
+
+    def update(self, id: int, fields: dict) -> None:
+        guild = {**self.get(id), **fields}
+        self.storage.upsert(guild)
+
+        self._configs[id] = guild
+        self._stored.add(id)
+        self.operations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'guilds': len(self._configs),
+            'hits': self.hits,
+            'misses': self.misses,
+            'storage_operations': self.operations
+        }
+
+# Jail and freeze states, indexed for constant-time checks and persisted across restarts.
+class ModerationState:
+    def __init__(self, storage: GuildStorage):
+        self.storage = storage
+
+        self.jails: Dict[Tuple[int, int], Tuple[str, int]] = {}
+        self.freezes: Dict[Tuple[int, int], int] = {}
+
+    def load(self) -> None:
+        self.jails = {(guild_id, member_id): (reason, jailer_id) for guild_id, member_id, reason, jailer_id in self.storage.all_jails()}
+        self.freezes = {(guild_id, channel_id): author_id for guild_id, channel_id, author_id in self.storage.all_freezes()}
+
+    def is_jailed(self, guild_id: int, member_id: int) -> bool:
+        return (guild_id, member_id) in self.jails
+
+    def jail(self, guild_id: int, member_id: int, reason: str, jailer_id: int) -> None:
+        self.jails[(guild_id, member_id)] = (reason, jailer_id)
+        self.storage.put_jail(guild_id, member_id, reason, jailer_id)
+
+    def unjail(self, guild_id: int, member_id: int) -> None:
+        if self.jails.pop((guild_id, member_id), None):
+            self.storage.delete_jail(guild_id, member_id)
+
+    def jailed_in(self, guild_id: int) -> List[Tuple[int, str, int]]:
+        return [
+            (member_id, reason, jailer_id)
+            for (jail_guild_id, member_id), (reason, jailer_id) in self.jails.items()
+            if jail_guild_id == guild_id
+        ]
+
+    def frozen_by(self, guild_id: int, channel_id: int) -> int | None:
+        return self.freezes.get((guild_id, channel_id))
+
+    def freeze(self, guild_id: int, channel_id: int, author_id: int) -> None:
+        self.freezes[(guild_id, channel_id)] = author_id
+        self.storage.put_freeze(guild_id, channel_id, author_id)
+
+    def thaw(self, guild_id: int) -> int:
+        channel_ids = [channel_id for (freeze_guild_id, channel_id) in self.freezes if freeze_guild_id == guild_id]
+
+        for channel_id in channel_ids:
+            del self.freezes[(guild_id, channel_id)]
+            self.storage.delete_freeze(guild_id, channel_id)
+
+        return len(channel_ids)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'jails': len(self.jails),
+            'freezes': len(self.freezes)
+        }
+
+
 # Implementation of the guild database.
-db = TinyDB('guild-db.json')
-Guild = Query()
+storage = open_guild_storage(GUILD_STORAGE)
+
+guild_configs = GuildConfigCache(storage)
+guild_configs.load()
+
+moderation = ModerationState(storage)
+moderation.load()
 
 # Implementation of Spotipy.
 sp = spotipy.Spotify(
@@ -122,13 +691,213 @@ sp = spotipy.Spotify(
 )
 
 
+# Recently deleted messages, kept in a bounded ring buffer per channel and expired after a TTL.
+class Snipe(NamedTuple):
+    deleted_at: float
+    author_name: str
+    author_avatar: str
+    content: str
+
+class SnipeBuffer:
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+
+        self._channels: Dict[int, collections.deque] = {}
+
+    def add(self, message: disnake.Message) -> None:
+        if not message.content:
+            return
+
+        buffer = self._channels.get(message.channel.id)
+        if buffer is None:
+            buffer = self._channels[message.channel.id] = collections.deque(maxlen=self.size)
+
+        buffer.append(Snipe(time.monotonic(), message.author.name, message.author.display_avatar.url, message.content))
+
+    def _expire(self, channel_id: int, now: float) -> collections.deque | None:
+        buffer = self._channels.get(channel_id)
+
+        if buffer is not None:
+            while buffer and now - buffer[0].deleted_at > self.ttl:
+                buffer.popleft()
+
+            if not buffer:
+                del self._channels[channel_id]
+                return None
+
+        return buffer
+
+    def get(self, channel_id: int) -> List[Snipe]:
+        buffer = self._expire(channel_id, time.monotonic())
+        return list(buffer) if buffer else []
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+
+        for channel_id in list(self._channels):
+            self._expire(channel_id, now)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'channels': len(self._channels),
+            'messages': sum(map(len, self._channels.values()))
+        }
+
+
+# LRU cache of bot-owned webhooks per channel, reused for every sniped message sent to that channel.
+class WebhookCache:
+    def __init__(self, size: int, concurrency: int):
+        self.size = size
+        self.concurrency = concurrency
+        self.messages = 0
+        self.rest_calls = 0
+
+        self._webhooks: collections.OrderedDict[int, disnake.Webhook] = collections.OrderedDict()
+        self._lookups: Dict[int, asyncio.Future] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def get(self, channel: disnake.TextChannel) -> disnake.Webhook:
+        webhook = self._webhooks.get(channel.id)
+
+        if webhook is not None:
+            self._webhooks.move_to_end(channel.id)
+            return webhook
+
+        # Concurrent senders share a single lookup instead of each creating their own webhook.
+        lookup = self._lookups.get(channel.id)
+        if lookup is None:
+            lookup = self._lookups[channel.id] = asyncio.ensure_future(self._lookup(channel))
+            lookup.add_done_callback(lambda _: self._lookups.pop(channel.id, None))
+
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, channel: disnake.TextChannel) -> disnake.Webhook:
+        webhooks = await channel.webhooks()
+        self.rest_calls += 1
+
+        webhook = next((webhook for webhook in webhooks if webhook.user and webhook.user.id == channel.guild.me.id), None)
+
+        if webhook is None:
+            webhook = await channel.create_webhook(name=channel.guild.me.name)
+            self.rest_calls += 1
+
+        self._webhooks[channel.id] = webhook
+        if len(self._webhooks) > self.size:
+            self._webhooks.popitem(last=False)
+
+        return webhook
+
+    async def send(self, channel: disnake.TextChannel, snipe: Snipe) -> None:
+        await self.send_many(channel, [snipe])
+
+    # One channel's snipes go out one by one, in the order they were deleted, since they all share the same
+    # webhook rate limit anyway. The semaphore caps how many channels are being sent to at once.
+    async def send_many(self, channel: disnake.TextChannel, snipes: List[Snipe]) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            for snipe in snipes:
+                await self._send(channel, snipe)
+
+    async def _send(self, channel: disnake.TextChannel, snipe: Snipe) -> None:
+        for attempt in range(2):
+            webhook = await self.get(channel)
+
+            try:
+                await webhook.send(snipe.content, username=snipe.author_name, avatar_url=snipe.author_avatar)
+                break
+            except disnake.NotFound:
+                self._webhooks.pop(channel.id, None)
+                if attempt:
+                    raise
+            finally:
+                self.rest_calls += 1
+
+        self.messages += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'channels': len(self._webhooks),
+            'messages': self.messages,
+            'rest_calls': self.rest_calls,
+            'saved_rest_calls': max(self.messages * 3 - self.rest_calls, 0)
+        }
+
+
+# LRU cache whose entries expire a fixed time after they were stored. Timestamps are wall-clock, so entries
+# can be dumped to disk and restored after a restart.
+class TTLCache:
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        self._entries: collections.OrderedDict[str, Tuple[float, Any]] = collections.OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any, stored_at: float | None = None) -> None:
+        self._entries[key] = (stored_at or time.time(), value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def dump(self) -> List[list]:
+        now = time.time()
+        return [[key, stored_at, value] for key, (stored_at, value) in self._entries.items() if now - stored_at <= self.ttl]
+
+    def restore(self, entries: List[list]) -> None:
+        now = time.time()
+
+        for key, stored_at, value in entries:
+            if now - stored_at <= self.ttl:
+                self.put(key, value, stored_at)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None
+        }
+
+
 # Global variables.
-global jail_members
-jail_members: List[int | str] = []
-global frozen_guilds
-frozen_guilds: List[int] = []
-global snipeables
-snipeables: List[disnake.Message] = []
+snipe_buffer = SnipeBuffer(SNIPE_BUFFER_SIZE, SNIPE_TTL)
+webhook_cache = WebhookCache(WEBHOOK_CACHE_SIZE, WEBHOOK_SEND_CONCURRENCY)
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+stream_cache = TTLCache(STREAM_CACHE_SIZE, STREAM_CACHE_TTL)
+
+global message_stats
+message_stats: Dict[str, int] = {
+    'messages': 0,
+    'storage_operations': 0,
+    'last_storage_operations': 0,
+    'max_storage_operations': 0
+}
 
 
 # Get prefix by guild ID.
@@ -136,9 +905,9 @@ def get_prefix(bot: commands.AutoShardedBot, message: disnake.Message):
     guild_prefix = PREFIX
 
     try:
-        for guild in db.all():
-            if guild['id'] == message.guild.id and guild['prefix']:
-                guild_prefix = guild['prefix']
+        guild = guild_configs.get(message.guild.id)
+        if guild and guild['prefix']:
+            guild_prefix = guild['prefix']
     except AttributeError:
         pass
 
@@ -147,8 +916,265 @@ def get_prefix(bot: commands.AutoShardedBot, message: disnake.Message):
 
 # Functions / coroutines (for using across the source).
 def get_guild_dict(id: int) -> dict:
-    guild = db.search(Guild.id == id)
-    return guild[0] if guild else None
+    return guild_configs.get(id)
+
+def load_ytdl_caches(path: str) -> None:
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+
+    search_cache.restore(data.get('searches', []))
+    stream_cache.restore(data.get('streams', []))
+
+def save_ytdl_caches(path: str, data: Dict[str, List[list]]) -> None:
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(data, file)
+
+    os.replace(f'{path}.tmp', path)
+
+def collect_stats() -> Dict[str, Any]:
+    return {
+        'guild_cache': guild_configs.stats(),
+        'moderation': moderation.stats(),
+        'moderation_pipeline': moderation_pipeline.stats(),
+        'profanity_filters': profanity_filters.stats(),
+        'snipes': snipe_buffer.stats(),
+        'webhooks': webhook_cache.stats(),
+        'qr_codes': render_qr_code.cache_info()._asdict(),
+        'ytdl_searches': search_cache.stats(),
+        'ytdl_streams': stream_cache.stats(),
+        'ytdl_extractions': extraction_pool.stats(),
+        'playback': {'track_gaps': track_gaps.stats(), **prebuffer_stats},
+        'voice': voice_governor.stats(),
+        'queue_journals': journal_stats,
+        'messages': message_stats
+    }
+
+def benchmark_profanity(corpus: List[str]) -> Dict[str, Any]:
+    results: Dict[str, Any] = {'messages': len(corpus)}
+    flagged: Dict[str, List[bool]] = {}
+
+    for name, matcher in (('better_profanity', profanity), ('automaton', profanity_matcher)):
+        started = time.perf_counter()
+        flagged[name] = [matcher.contains_profanity(message) for message in corpus]
+        elapsed = time.perf_counter() - started
+
+        results[name] = {
+            'flagged': sum(flagged[name]),
+            'total_ms': round(elapsed * 1000, 3),
+            'per_message_us': round(elapsed / len(corpus) * 1000000, 3)
+        }
+
+    results['disagreements'] = sum(a != b for a, b in zip(flagged['better_profanity'], flagged['automaton']))
+    return results
+
+# Stand-in for youtube-dl's page parsing: pure Python work on a large JSON document, holding the GIL throughout.
+def parse_synthetic_page(entries: int) -> int:
+    page = json.dumps({
+        'contents': [
+            {
+                'videoRenderer': {
+                    'videoId': f'{i:011d}',
+                    'title': {'runs': [{'text': f'Track {i}'}]},
+                    'lengthText': {'simpleText': f'{i % 60}:{i % 60:02d}'}
+                }
+            }
+            for i in range(entries)
+        ]
+    })
+
+    data = json.loads(page)
+    return len(re.findall(r'"videoId": "(\d+)"', page)) + len(data['contents'])
+
+async def benchmark_extraction(jobs: int, entries: int) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    results: Dict[str, Any] = {'jobs': jobs, 'entries_per_job': entries, 'workers': YTDL_WORKERS}
+
+    for mode in ('thread', 'process'):
+        # Forking a new process pool now would copy locks held by the bot's other threads, so the process side
+        # reuses the extraction pool's own workers, forked at startup, and is skipped when there are none.
+        if mode == 'process':
+            if extraction_pool.mode != 'process':
+                results[mode] = {'skipped': 'The extraction pool runs on threads. Set YTDL_EXECUTOR=process to benchmark processes.'}
+                continue
+
+            executor = extraction_pool._executor
+        else:
+            executor = create_extraction_executor(mode, YTDL_WORKERS)
+
+        lags = LatencyHistogram()
+        worst = 0.0
+        running = True
+
+        async def probe():
+            nonlocal worst
+
+            while running:
+                started = time.perf_counter()
+                await asyncio.sleep(BENCHMARK_PROBE_INTERVAL)
+                lag = max(time.perf_counter() - started - BENCHMARK_PROBE_INTERVAL, 0)
+
+                lags.observe(lag)
+                worst = max(worst, lag)
+
+        prober = loop.create_task(probe())
+        started = time.perf_counter()
+
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, parse_synthetic_page, entries) for _ in range(jobs)))
+        finally:
+            elapsed = time.perf_counter() - started
+            running = False
+            await prober
+
+            if executor is not extraction_pool._executor:
+                await loop.run_in_executor(None, executor.shutdown)
+
+        results[mode] = {
+            'total_ms': round(elapsed * 1000, 3),
+            'max_loop_lag_ms': round(worst * 1000, 3),
+            'loop_lag': lags.stats()
+        }
+
+    return results
+
+# CPU spent per second of audio per session, for the old decode / scale / re-encode path versus Opus passthrough.
+# Python-side time is this whole process's CPU time, so it also picks up whatever else the bot is doing meanwhile.
+def benchmark_audio(sessions: int, seconds: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {'sessions': sessions, 'audio_seconds': seconds, 'opus_encoder': disnake.opus.is_loaded()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        sample = os.path.join(directory, 'sample.opus')
+        subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}', '-ac', '2', '-c:a', 'libopus', '-b:a', '128k', sample],
+            check=True
+        )
+
+        def play(mode: str):
+            encoder = None
+
+            if mode == 'pcm':
+                source = disnake.PCMVolumeTransformer(disnake.FFmpegPCMAudio(sample), 0.5)
+                encoder = disnake.opus.Encoder() if disnake.opus.is_loaded() else None
+            else:
+                source = disnake.FFmpegOpusAudio(sample, codec='opus')
+
+            try:
+                while frame := source.read():
+                    if encoder is not None:
+                        encoder.encode(frame.ljust(disnake.opus.Encoder.FRAME_SIZE, b'\0'), disnake.opus.Encoder.SAMPLES_PER_FRAME)
+            finally:
+                source.cleanup()
+
+        for mode in ('pcm', 'opus'):
+            cpu_before = time.process_time()
+            children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+            threads = [Thread(target=play, args=(mode,)) for _ in range(sessions)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            python_cpu = time.process_time() - cpu_before
+            children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            ffmpeg_cpu = (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+
+            results[mode] = {
+                'python_cpu_ms': round(python_cpu * 1000, 3),
+                'ffmpeg_cpu_ms': round(ffmpeg_cpu * 1000, 3),
+                'cpu_ms_per_session_second': round((python_cpu + ffmpeg_cpu) / (sessions * seconds) * 1000, 3)
+            }
+
+    return results
+
+# Shaped like what youtube-dl returns for a single YouTube video, formats and thumbnails included.
+def synthetic_ytdl_info(index: int) -> Dict[str, Any]:
+    video_id = f'{index:011d}'
+    signature = 'x' * 400
+
+    return {
+        'id': video_id,
+        'title': f'Synthetic track {index}',
+        'description': f'Description of track {index}. ' * 60,
+        'uploader': f'Uploader {index % 100}',
+        'uploader_id': f'UC{index:022d}',
+        'uploader_url': f'https://www.youtube.com/channel/UC{index:022d}',
+        'channel_id': f'UC{index:022d}',
+        'upload_date': '20220101',
+        'duration': 180 + index % 240,
+        'view_count': index * 1000,
+        'like_count': index * 10,
+        'dislike_count': index,
+        'average_rating': 4.8,
+        'age_limit': 0,
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'thumbnail': f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg',
+        'thumbnails': [
+            {'url': f'https://i.ytimg.com/vi/{video_id}/{i}.jpg', 'width': 120 * i, 'height': 90 * i, 'id': str(i), 'resolution': f'{120 * i}x{90 * i}'}
+            for i in range(1, 41)
+        ],
+        'tags': [f'tag{i}' for i in range(20)],
+        'categories': ['Music'],
+        'formats': [
+            {
+                'format_id': str(100 + i),
+                'url': f'https://rr1---sn.googlevideo.com/videoplayback?id={video_id}&itag={100 + i}&sig={signature}',
+                'ext': 'webm' if i % 2 else 'm4a',
+                'acodec': 'opus' if i % 2 else 'mp4a.40.2',
+                'vcodec': 'none' if i < 4 else 'vp9',
+                'abr': 48 + i * 16,
+                'asr': 48000,
+                'filesize': 3000000 + i * 100000,
+                'format_note': f'{144 * i}p',
+                'http_headers': {
+                    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64)',
+                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                    'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.7',
+                    'Accept-Encoding': 'gzip, deflate',
+                    'Accept-Language': 'en-us,en;q=0.5'
+                }
+            }
+            for i in range(20)
+        ]
+    }
+
+# Bytes kept alive per queued song: holding the full info dict, the trimmed dict, and the compact track record.
+# Runs in an executor so it can't stall the gateway, so allocations the bot makes meanwhile count as noise.
+def benchmark_queue(ctx: commands.Context, count: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {'songs': count}
+    retainers = (
+        ('full_info', lambda info: info),
+        ('trimmed_info', YTDLSource.trim_info),
+        ('track_info', lambda info: None)
+    )
+
+    for name, retain in retainers:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        try:
+            queue = []
+            for index in range(count):
+                info = synthetic_ytdl_info(index)
+                queue.append((Song(ctx, YTDLSource.trim_info(info)), retain(info)))
+
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+
+        del queue
+        results[name] = {
+            'total_kb': round(retained / 1024, 3),
+            'bytes_per_song': round(retained / count)
+        }
+
+    return results
+
+def generate_json_file(name: str, data: Any) -> disnake.File:
+    return disnake.File(io.BytesIO(json.dumps(data, indent=4).encode()), filename=f'{name}.json')
 
 def generate_random_footer() -> str:
     footers_list = [
@@ -169,14 +1195,17 @@ def generate_random_footer() -> str:
     ]
     return random.choice(footers_list)
 
-def generate_qr_code(id: int, text_to_embed: str) -> Tuple[str, disnake.File]:
-    img = qrcode.make(text_to_embed)
+@functools.lru_cache(maxsize=QR_CODE_CACHE_SIZE)
+def render_qr_code(text_to_embed: str) -> bytes:
+    buffer = io.BytesIO()
+    qrcode.make(text_to_embed).save(buffer, format='PNG')
+    return buffer.getvalue()
 
-    file_name = f'{id}.png'
-    img.save(file_name)
-    file = disnake.File(file_name, filename=file_name)
+async def generate_qr_code(id: int, text_to_embed: str) -> Tuple[str, disnake.File]:
+    png = await bot.loop.run_in_executor(None, render_qr_code, text_to_embed)
 
-    return file_name, file
+    file_name = f'{id}.png'
+    return file_name, disnake.File(io.BytesIO(png), filename=file_name)
 
 def generate_error_embed(title: str, description: str, footer_avatar) -> disnake.Embed:
     return (
@@ -197,37 +1226,88 @@ async def wait_for_message(member: disnake.Member, check_if_member: bool) -> dis
     message = await bot.wait_for('message', check=is_author, timeout=30)
     return message
 
-async def check_if_frozen(message: disnake.Message) -> bool:
-    for frozen_guild in frozen_guilds:
-        if (
-            frozen_guild[1] == message.guild.id 
-            and frozen_guild[2] == message.channel.id 
-            and frozen_guild[0] != message.author.id
-        ):
-            await message.delete()
-            return True
+def check_if_jailed(message: disnake.Message, guild: dict) -> bool:
+    return moderation.is_jailed(message.guild.id, message.author.id)
 
-async def check_if_swore(message: disnake.Message) -> bool:
-    try:
-        guild = get_guild_dict(message.guild.id)
-    except AttributeError:
-        return 
+def check_if_frozen(message: disnake.Message, guild: dict) -> bool:
+    author_id = moderation.frozen_by(message.guild.id, message.channel.id)
+    return author_id is not None and author_id != message.author.id
 
-    if (
-        not message.author.bot
-        and message.channel != disnake.DMChannel
+def check_if_swore(message: disnake.Message, guild: dict) -> bool:
+    return (
+        guild['filter_profanity']
+        and not message.author.bot
         and not message.channel.is_nsfw()
-        and profanity.contains_profanity(message.content)
-        and guild['filter_profanity']
-    ):
-        await message.delete()
-        return True
+        and profanity_filters.contains_profanity(guild, message.content)
+    )
+
+
+# Fixed-bucket latency histogram for timing hot paths.
+class LatencyHistogram:
+    BUCKETS: Tuple[float, ...] = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+    def __init__(self, buckets: Tuple[float, ...] | None = None):
+        self.buckets = buckets or self.BUCKETS
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.samples = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.samples += 1
+        self.total += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        buckets = {f'<={bound * 1000:g}ms': count for bound, count in zip(self.buckets, self.counts)}
+        buckets[f'>{self.buckets[-1] * 1000:g}ms'] = self.counts[-1]
 
-async def check_if_jailed(message: disnake.Message) -> bool:
-    for jail_member in jail_members:
-        if jail_member[1] == message.guild.id and jail_member[0] == message.author.id:
+        return {
+            'samples': self.samples,
+            'mean_ms': round(self.total / self.samples * 1000, 3) if self.samples else 0,
+            'buckets': buckets
+        }
+
+
+# Message moderation pipeline, which runs its stages in the order they were added and stops at the first rejection.
+class ModerationPipeline:
+    def __init__(self):
+        self.stages: List[Tuple[str, Callable[[disnake.Message, dict], bool]]] = []
+        self.histograms: Dict[str, LatencyHistogram] = {'total': LatencyHistogram()}
+
+    def add_stage(self, name: str, check: Callable[[disnake.Message, dict], bool]) -> None:
+        self.stages.append((name, check))
+        self.histograms[name] = LatencyHistogram()
+
+    async def run(self, message: disnake.Message) -> bool:
+        if not message.guild:
+            return False
+
+        started = time.perf_counter()
+        guild = guild_configs.get(message.guild.id)
+        rejected = False
+
+        for name, check in self.stages:
+            stage_started = time.perf_counter()
+            rejected = check(message, guild)
+            self.histograms[name].observe(time.perf_counter() - stage_started)
+
+            if rejected:
+                break
+
+        self.histograms['total'].observe(time.perf_counter() - started)
+
+        if rejected:
             await message.delete()
-            return True
+
+        return rejected
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: histogram.stats() for name, histogram in self.histograms.items()}
+
+moderation_pipeline = ModerationPipeline()
+moderation_pipeline.add_stage('jail', check_if_jailed)
+moderation_pipeline.add_stage('freeze', check_if_frozen)
+moderation_pipeline.add_stage('profanity', check_if_swore)
 
 
 # Command-specific checks.
@@ -239,9 +1319,15 @@ def is_developer(ctx: commands.Context) -> bool:
 class VoiceError(Exception):
     pass
 
+class VoiceCapacityError(commands.CommandError):
+    pass
+
 class YTDLError(Exception):
     pass
 
+class ExtractorBusy(YTDLError):
+    pass
+
 
 # Dropdowns (dynamic).
 class HelpCommandDropdown(disnake.ui.Select):
@@ -395,14 +1481,23 @@ class Bot(commands.AutoShardedBot):
         )
         
         self.task_update_presence.start()
+        self.task_sweep_snipes.start()
+
+        if YTDL_CACHE_FILE:
+            load_ytdl_caches(YTDL_CACHE_FILE)
+            self.task_persist_ytdl_caches.start()
 
     async def on_connect(self):
         os.system('clear')
         print(f'{self.user} | Connected to Discord\n')
 
     async def on_ready(self):
+        guild_configs.ensure([guild.id for guild in self.guilds])
         print(f'Deployed in {len(self.guilds)} server(s) with {self.shard_count} shard(s) active.')
 
+    async def on_guild_join(self, guild: disnake.Guild):
+        guild_configs.ensure([guild.id])
+
     @tasks.loop(seconds=200)
     async def task_update_presence(self):
         await self.change_presence(
@@ -417,35 +1512,32 @@ class Bot(commands.AutoShardedBot):
     async def task_before_updating_presence(self):
         await self.wait_until_ready()
 
+    @tasks.loop(seconds=SNIPE_TTL)
+    async def task_sweep_snipes(self):
+        snipe_buffer.sweep()
+
+    @tasks.loop(seconds=YTDL_CACHE_PERSIST_INTERVAL)
+    async def task_persist_ytdl_caches(self):
+        data = {'searches': search_cache.dump(), 'streams': stream_cache.dump()}
+        await self.loop.run_in_executor(None, save_ytdl_caches, YTDL_CACHE_FILE, data)
+
     async def on_message(self, message: disnake.Message):
         if message.author == self.user:
             return
 
-        try:
-            if not db.search(Guild.id == message.guild.id):
-                db.insert(
-                    {
-                        'id': message.guild.id, 
-                        'prefix': None, 
-                        'filter_profanity': False,
-                        'greet_message': None
-                    }
-                )
-        except AttributeError:
-            pass
+        storage_operations = guild_configs.operations
 
-        if (
-            not await check_if_swore(message)
-            and not await check_if_frozen(message)
-            and not await check_if_jailed(message)
-        ):
+        if not await moderation_pipeline.run(message):
             await self.process_commands(message)
 
+        storage_operations = guild_configs.operations - storage_operations
+        message_stats['messages'] += 1
+        message_stats['storage_operations'] += storage_operations
+        message_stats['last_storage_operations'] = storage_operations
+        message_stats['max_storage_operations'] = max(message_stats['max_storage_operations'], storage_operations)
+
     async def on_message_delete(self, message: disnake.Message):
-        global snipeables
-        snipeables.append(message)
-        await asyncio.sleep(25)
-        snipeables.remove(message)
+        snipe_buffer.add(message)
 
     async def on_member_join(self, member: disnake.Member):
         guild = get_guild_dict(member.guild.id)
@@ -516,6 +1608,9 @@ class ExceptionHandler(commands.Cog):
         elif isinstance(error, commands.errors.MissingRequiredArgument):
             await ctx.reply(embed=generate_error_embed(title='You\'re missing a required argument.', description=f'{error} Try typing `{ctx.prefix}help {ctx.command}` for more information on how to use this command.', footer_avatar=ctx.author.avatar))
 
+        elif isinstance(error, ExtractorBusy):
+            await ctx.reply(embed=generate_error_embed(title='I\'m busy fetching music right now.', description=error, footer_avatar=ctx.author.avatar))
+
         elif isinstance(error, commands.errors.CommandError):
             await ctx.reply(embed=generate_error_embed(title='A command error occured!', description=error, footer_avatar=ctx.author.avatar))
 
@@ -791,7 +1886,7 @@ class Inspection(commands.Cog):
         if not user:
             user = ctx.author
 
-        qr_file_name, qr_file = generate_qr_code(id=user.id, text_to_embed=f'https://discordapp.com/users/{user.id}/')
+        qr_file_name, qr_file = await generate_qr_code(id=user.id, text_to_embed=f'https://discordapp.com/users/{user.id}/')
 
         embed = (
             disnake.Embed(
@@ -836,9 +1931,6 @@ class Inspection(commands.Cog):
             )
 
         await ctx.reply(file=qr_file, embed=embed)
-        
-        if os.path.exists(qr_file_name):
-            os.remove(qr_file_name)
 
     @commands.slash_command(
         name='userinfo', 
@@ -853,7 +1945,7 @@ class Inspection(commands.Cog):
         if not user:
             user = interaction.author
 
-        qr_file_name, qr_file = generate_qr_code(id=user.id, text_to_embed=f'https://discordapp.com/users/{user.id}/')
+        qr_file_name, qr_file = await generate_qr_code(id=user.id, text_to_embed=f'https://discordapp.com/users/{user.id}/')
 
         embed = (
             disnake.Embed(
@@ -898,9 +1990,6 @@ class Inspection(commands.Cog):
             )
 
         await interaction.send(file=qr_file, embed=embed)
-        
-        if os.path.exists(qr_file_name):
-            os.remove(qr_file_name)
 
     @commands.command(
         name='guildinfo', 
@@ -1217,12 +2306,10 @@ class GeneralMod(commands.Cog):
     @commands.guild_only()
     @commands.has_any_role(LOCK_ROLES['MODERATOR'], LOCK_ROLES['ADMIN'])
     async def snipemsg(self, ctx: commands.Context):
-        if snipeables:
-            for snipeable in snipeables:
-                if snipeable.guild == ctx.guild:
-                    webhook = await ctx.message.channel.create_webhook(name=snipeable.author.name)
-                    await webhook.send(snipeable.content, username=snipeable.author.name, avatar_url=snipeable.author.avatar)
-                    await webhook.delete()
+        snipes = snipe_buffer.get(ctx.channel.id)
+
+        if snipes:
+            await webhook_cache.send_many(ctx.channel, snipes)
 
         else:
             await ctx.reply('No messages were found in my list.')
@@ -1253,7 +2340,7 @@ class GeneralMod(commands.Cog):
             await ctx.reply('You can\'t jail an admin!')
 
         if do_jail:
-            jail_members.append([member.id, ctx.guild.id, reason, ctx.author.id])
+            moderation.jail(ctx.guild.id, member.id, reason, ctx.author.id)
             await ctx.send(f'You\'ve been captured! {member.mention} | Reason: {reason}')
             await ctx.message.delete()
 
@@ -1276,14 +2363,17 @@ class GeneralMod(commands.Cog):
             )
         )
 
-        for jail_member in jail_members:
-            if jail_member[1] == ctx.guild.id:
-                embed.add_field(
-                    name=self.bot.get_user(jail_member[0]).name, 
-                    value=('Jailed by ' + self.bot.get_user(jail_member[3]).mention + ' | Reason: `' + jail_member[2] + '`'), 
-                    inline=False
-                )
-                jail_has_member = True
+        for member_id, reason, jailer_id in moderation.jailed_in(ctx.guild.id):
+            # Jails restored from storage may name users who aren't cached anymore, or have left.
+            member = self.bot.get_user(member_id)
+            jailer = self.bot.get_user(jailer_id)
+
+            embed.add_field(
+                name=member.name if member else f'<@{member_id}>', 
+                value=('Jailed by ' + (jailer.mention if jailer else f'<@{jailer_id}>') + ' | Reason: `' + reason + '`'), 
+                inline=False
+            )
+            jail_has_member = True
 
         if not jail_has_member:
             await ctx.reply('No members are inside the jail.')
@@ -1298,14 +2388,13 @@ class GeneralMod(commands.Cog):
     @commands.guild_only()
     @commands.has_any_role(LOCK_ROLES['MODERATOR'], LOCK_ROLES['ADMIN'])
     async def unjail(self, ctx: commands.Context, member: disnake.Member):
-        for jail_member in jail_members:
-            if jail_member[1] == ctx.guild.id and jail_member[0] == member.id:
-                if member != ctx.author:
-                    jail_members.remove(jail_member)
-                    await ctx.message.add_reaction(REACTION_EMOJI)
+        if moderation.is_jailed(ctx.guild.id, member.id):
+            if member != ctx.author:
+                moderation.unjail(ctx.guild.id, member.id)
+                await ctx.message.add_reaction(REACTION_EMOJI)
 
-                else:
-                    await ctx.reply('You can\'t free yourself!')
+            else:
+                await ctx.reply('You can\'t free yourself!')
 
     @commands.command(
         name='block', 
@@ -1425,7 +2514,7 @@ class GeneralMod(commands.Cog):
     @commands.guild_only()
     @commands.has_role(LOCK_ROLES['ADMIN'])
     async def freeze(self, ctx: commands.Context):
-        frozen_guilds.append([ctx.author.id, ctx.guild.id, ctx.message.channel.id])
+        moderation.freeze(ctx.guild.id, ctx.message.channel.id, ctx.author.id)
         await ctx.send(f'**Chat was frozen by {ctx.author.mention}!**')
         await ctx.message.delete()
 
@@ -1436,10 +2525,8 @@ class GeneralMod(commands.Cog):
     @commands.guild_only()
     @commands.has_role(LOCK_ROLES['ADMIN'])
     async def thaw(self, ctx: commands.Context):
-        for frozen_guild in frozen_guilds:
-            if frozen_guild[1] == ctx.guild.id:
-                frozen_guilds.remove(frozen_guild)
-                await ctx.message.add_reaction(REACTION_EMOJI)
+        if moderation.thaw(ctx.guild.id):
+            await ctx.message.add_reaction(REACTION_EMOJI)
 
 
 # Voice moderation commands.
@@ -1509,7 +2596,7 @@ class Customization(commands.Cog):
             reason = f'Inviter: {ctx.author.name}'
 
         invite = await ctx.channel.create_invite(max_age=max_age, max_uses=max_uses, reason=reason)
-        qr_file_name, qr_file = generate_qr_code(id=ctx.author.id, text_to_embed=invite)
+        qr_file_name, qr_file = await generate_qr_code(id=ctx.author.id, text_to_embed=str(invite))
         value = 'Infinity' if invite.max_age == 0 else f'{invite.max_age} Seconds'
 
         embed = (
@@ -1536,9 +2623,6 @@ class Customization(commands.Cog):
 
         await ctx.reply(file=qr_file, embed=embed)
 
-        if os.path.exists(qr_file_name):
-            os.remove(qr_file_name)
-
     @commands.command(
         name='invs', 
         help='Shows all active server invite codes.'
@@ -1705,7 +2789,7 @@ class Tweaks(commands.Cog):
     @commands.guild_only()
     @commands.has_role(LOCK_ROLES['ADMIN'])
     async def prefix(self, ctx: commands.Context, prefix: str | None):
-        db.update({'prefix': prefix}, Guild.id == ctx.guild.id)
+        guild_configs.update(ctx.guild.id, {'prefix': prefix})
         await ctx.reply(f'Changed server prefix to `{prefix}`!')
 
     @commands.command(
@@ -1726,10 +2810,10 @@ class Tweaks(commands.Cog):
                     icon_url=ctx.author.avatar
                 )
             )
-            db.update({'greet_message': greet_message}, Guild.id == ctx.guild.id)
+            guild_configs.update(ctx.guild.id, {'greet_message': greet_message})
             await ctx.reply(embed=embed)
         else:
-            db.update({'greet_message': None}, Guild.id == ctx.guild.id)
+            guild_configs.update(ctx.guild.id, {'greet_message': None})
             await ctx.reply('Greetings have been disabled.')
 
     @commands.command(
@@ -1741,32 +2825,271 @@ class Tweaks(commands.Cog):
     async def profanityfilter(self, ctx: commands.Context):
         guild = get_guild_dict(ctx.guild.id)
         previous_value = guild['filter_profanity']
-        db.update({'filter_profanity': not previous_value}, Guild.id == ctx.guild.id)
+        guild_configs.update(ctx.guild.id, {'filter_profanity': not previous_value})
         await ctx.reply(f'Profanity filter has been toggled `{not previous_value}`.')
 
-    @commands.command(
-        name='config',
-        help='Shows the server\'s configuration data in a JSON file format.'
-    )
-    @commands.guild_only()
-    @commands.has_role(LOCK_ROLES['ADMIN'])
-    async def viewconfig(self, ctx: commands.Context):
+    async def edit_filter_words(self, ctx: commands.Context, word: str, *, deny: bool | None):
+        word = word.strip().lower()
         guild = get_guild_dict(ctx.guild.id)
-        embed = (
-            disnake.Embed(
-                color=ACCENT_COLOR['PRIMARY']
-            ).add_field(
-                name='Current Configuration',
-                value=f'```json\n{json.dumps(guild, indent=4)}\n```'
-            )
-        )
-        await ctx.reply(embed=embed)
 
+        allowed_words = [allowed_word for allowed_word in guild.get('profanity_allow', []) if allowed_word != word]
+        denied_words = [denied_word for denied_word in guild.get('profanity_deny', []) if denied_word != word]
 
-# Music commands.
-youtube_dl.utils.bug_reports_message = lambda: ''
+        if deny is True:
+            denied_words.append(word)
+        elif deny is False:
+            allowed_words.append(word)
 
-class YTDLSource(disnake.PCMVolumeTransformer):
+        if len(allowed_words) + len(denied_words) > MAX_GUILD_FILTER_WORDS:
+            return await ctx.reply(f'The profanity filter of this server can\'t hold more than {MAX_GUILD_FILTER_WORDS} custom words.')
+
+        guild_configs.update(ctx.guild.id, {'profanity_allow': allowed_words, 'profanity_deny': denied_words})
+        profanity_filters.invalidate(ctx.guild.id)
+        await ctx.message.add_reaction(REACTION_EMOJI)
+
+    @commands.command(
+        name='denyword',
+        help='Adds a word to the server\'s profanity filter.'
+    )
+    @commands.guild_only()
+    @commands.has_role(LOCK_ROLES['ADMIN'])
+    async def denyword(self, ctx: commands.Context, *, word: str):
+        await self.edit_filter_words(ctx, word, deny=True)
+
+    @commands.command(
+        name='allowword',
+        help='Lets a word through the server\'s profanity filter.'
+    )
+    @commands.guild_only()
+    @commands.has_role(LOCK_ROLES['ADMIN'])
+    async def allowword(self, ctx: commands.Context, *, word: str):
+        await self.edit_filter_words(ctx, word, deny=False)
+
+    @commands.command(
+        name='unlistword',
+        help='Removes a word from the server\'s custom profanity filter lists.'
+    )
+    @commands.guild_only()
+    @commands.has_role(LOCK_ROLES['ADMIN'])
+    async def unlistword(self, ctx: commands.Context, *, word: str):
+        await self.edit_filter_words(ctx, word, deny=None)
+
+    @commands.command(
+        name='filterwords',
+        help='Shows the server\'s custom profanity filter lists.'
+    )
+    @commands.guild_only()
+    @commands.has_role(LOCK_ROLES['ADMIN'])
+    async def filterwords(self, ctx: commands.Context):
+        guild = get_guild_dict(ctx.guild.id)
+
+        embed = (
+            disnake.Embed(
+                title='Custom Profanity Filter',
+                color=ACCENT_COLOR['PRIMARY']
+            ).add_field(
+                name='Denied',
+                value=', '.join(f'`{word}`' for word in guild.get('profanity_deny', [])) or 'None',
+                inline=False
+            ).add_field(
+                name='Allowed',
+                value=', '.join(f'`{word}`' for word in guild.get('profanity_allow', [])) or 'None',
+                inline=False
+            ).add_field(
+                name='Memory Usage',
+                value=f'{profanity_filters.memory_usage(guild)} bytes',
+                inline=False
+            ).set_footer(
+                text=generate_random_footer(),
+                icon_url=ctx.author.avatar
+            )
+        )
+        await ctx.reply(embed=embed)
+
+    @commands.command(
+        name='config',
+        help='Shows the server\'s configuration data in a JSON file format.'
+    )
+    @commands.guild_only()
+    @commands.has_role(LOCK_ROLES['ADMIN'])
+    async def viewconfig(self, ctx: commands.Context):
+        guild = get_guild_dict(ctx.guild.id)
+        embed = (
+            disnake.Embed(
+                color=ACCENT_COLOR['PRIMARY']
+            ).add_field(
+                name='Current Configuration',
+                value=f'```json\n{json.dumps(guild, indent=4)}\n```'
+            )
+        )
+        await ctx.reply(embed=embed)
+
+
+# Entry points for extraction workers. In process mode each worker builds its own YoutubeDL instance, and
+# youtube-dl errors are flattened since the traceback they carry can't be pickled back to the bot.
+def init_extraction_worker() -> None:
+    YTDLSource.ytdl = youtube_dl.YoutubeDL(YTDLSource.YTDL_OPTIONS)
+
+def run_extraction(func: Callable, *args) -> Any:
+    try:
+        return func(*args)
+    except youtube_dl.utils.DownloadError as e:
+        raise YTDLError(str(e)) from None
+
+def create_extraction_executor(mode: str, workers: int) -> concurrent.futures.Executor:
+    if mode == 'process':
+        # Fork instead of spawn, as spawned children would re-run this module (and the bot) from the top.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=init_extraction_worker
+        )
+        concurrent.futures.wait([executor.submit(os.getpid) for _ in range(workers)])
+        return executor
+
+    return concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl')
+
+
+# Dedicated pool for youtube-dl extractions. Jobs wait in per-guild queues that are drained round-robin,
+# so one guild's bulk import can't hold up everybody else, and the total backlog is capped.
+class ExtractionPool:
+    BUCKETS: Tuple[float, ...] = (0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+    def __init__(self, workers: int, max_pending: int, mode: str = 'thread'):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.mode = mode
+        self.completed = 0
+        self.rejected = 0
+
+        self.wait_times = LatencyHistogram(self.BUCKETS)
+        self.run_times = LatencyHistogram(self.BUCKETS)
+
+        self._executor = create_extraction_executor(mode, workers)
+        self._queues: collections.OrderedDict[int, collections.deque] = collections.OrderedDict()
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+        self._pending = 0
+        self._running = 0
+
+    # Interactive lookups fail fast when the pool is full, while bulk imports may wait up to `patience` seconds for room.
+    async def run(self, guild_id: int, func: Callable, *args, bounded: bool = True, patience: float = 0.0) -> Any:
+        if bounded and self._pending >= self.max_pending:
+            await self._wait_for_capacity(patience)
+
+        future = asyncio.get_running_loop().create_future()
+
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = self._queues[guild_id] = collections.deque()
+
+        queue.append((future, func, args, time.perf_counter()))
+        self._pending += 1
+        self._dispatch()
+
+        return await future
+
+    async def _wait_for_capacity(self, patience: float) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + patience
+
+        while self._pending >= self.max_pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.rejected += 1
+                raise ExtractorBusy('Too many songs are being looked up at the moment, try again in a bit.')
+
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def _dispatch(self) -> None:
+        while self._running < self.workers and self._queues:
+            guild_id, queue = next(iter(self._queues.items()))
+            future, func, args, queued_at = queue.popleft()
+            self._pending -= 1
+
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+
+            if queue:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+
+            if future.cancelled():
+                continue
+
+            started = time.perf_counter()
+            self.wait_times.observe(started - queued_at)
+            self._running += 1
+
+            job = asyncio.get_running_loop().run_in_executor(self._executor, run_extraction, func, *args)
+            job.add_done_callback(functools.partial(self._finish, future, started))
+
+    def _finish(self, future: asyncio.Future, started: float, job: asyncio.Future) -> None:
+        self._running -= 1
+        self.completed += 1
+        self.run_times.observe(time.perf_counter() - started)
+
+        if not future.cancelled():
+            if job.exception() is not None:
+                future.set_exception(job.exception())
+            else:
+                future.set_result(job.result())
+
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'running': self._running,
+            'pending': self._pending,
+            'guilds_waiting': len(self._queues),
+            'imports_waiting': len(self._waiters),
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_time': self.wait_times.stats(),
+            'run_time': self.run_times.stats()
+        }
+
+
+# Music commands.
+youtube_dl.utils.bug_reports_message = lambda: ''
+
+# The few fields the player and the song embeds read. Queued songs keep only this, never youtube-dl's info dicts.
+class TrackInfo(NamedTuple):
+    title: str
+    webpage_url: str
+    uploader: str | None = None
+    uploader_url: str | None = None
+    thumbnail: str | None = None
+    duration: int | None = None
+    acodec: str | None = None
+
+    @classmethod
+    def from_info(cls, info: dict) -> 'TrackInfo':
+        return cls(
+            title=info.get('title'),
+            webpage_url=info.get('webpage_url'),
+            uploader=info.get('uploader'),
+            uploader_url=info.get('uploader_url'),
+            thumbnail=info.get('thumbnail'),
+            duration=int(info['duration']) if info.get('duration') else None,
+            acodec=info.get('acodec')
+        )
+
+class YTDLSource(disnake.AudioSource):
     YTDL_OPTIONS = {
         'format': 'bestaudio/best',
         'extractaudio': True,
@@ -1789,60 +3112,103 @@ class YTDLSource(disnake.PCMVolumeTransformer):
     }
 
     ytdl = youtube_dl.YoutubeDL(YTDL_OPTIONS)
-    ytdl.cache.remove()
 
-    def __init__(self, ctx: commands.Context, source: disnake.FFmpegPCMAudio, *, data: dict, volume: float=0.5):
-        super().__init__(source, volume)
+    METADATA_FIELDS = TrackInfo._fields
 
-        self.requester = ctx.author
-        self.channel = ctx.channel
-        self.data = data
+    def __init__(self, song: 'Song', source: disnake.AudioSource, *, volume: float=DEFAULT_VOLUME, offset: float=0.0):
+        # PCM gets scaled frame by frame in Python. Opus is played as it is, with any volume already applied by ffmpeg.
+        self.audio = source
+        self.original = source if source.is_opus() else disnake.PCMVolumeTransformer(source, volume)
+        self._volume = volume
 
-        self.uploader = data.get('uploader')
-        self.uploader_url = data.get('uploader_url')
-
-        date = data.get('upload_date')
-        self.upload_date = date[6:8] + '.' + date[4:6] + '.' + date[0:4]
-        
-        self.title = data.get('title')
-        self.thumbnail = data.get('thumbnail')
-        self.description = data.get('description')
-        self.duration = self.parse_duration(int(data.get('duration')))
-        self.tags = data.get('tags')
-        self.url = data.get('webpage_url')
-        self.views = data.get('view_count')
-        self.likes = data.get('like_count')
-        self.dislikes = data.get('dislike_count')
-        self.stream_url = data.get('url')
+        self.track = song.track
+        self.requester = song.requester
+        self.channel = song.channel
+        self.stream_url = song.stream_url
+        self.frames_read = int(offset * 1000 / disnake.opus.Encoder.FRAME_LENGTH)
 
     def __str__(self):
-        return "**{0.title}** by **[{0.uploader}]({0.uploader_url})**".format(self)
+        return "**{0.title}** by **[{0.uploader}]({0.uploader_url})**".format(self.track)
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = value
+
+        if isinstance(self.original, disnake.PCMVolumeTransformer):
+            self.original.volume = value
+
+    @property
+    def position(self) -> float:
+        return self.frames_read * disnake.opus.Encoder.FRAME_LENGTH / 1000
+
+    @property
+    def is_recording(self) -> bool:
+        recording = getattr(self.audio, 'recording', None)
+        return recording is not None and recording.active
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def read(self) -> bytes:
+        self.frames_read += 1
+        return self.original.read()
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+    def prebuffer(self, frames: int) -> None:
+        self.audio.prebuffer(frames)
+
+    @classmethod
+    def create_audio(cls, stream_url: str, *, codec: str | None, volume: float, offset: float=0.0) -> disnake.AudioSource:
+        before_options = cls.FFMPEG_OPTIONS['before_options'] + (f' -ss {offset:.2f}' if offset else '')
+
+        if MUSIC_AUDIO_MODE != 'opus':
+            return disnake.FFmpegPCMAudio(stream_url, before_options=before_options, options=cls.FFMPEG_OPTIONS['options'])
+
+        # Opus streams are copied untouched at full volume. Anything else is encoded by ffmpeg, volume included.
+        if volume == 1.0:
+            return disnake.FFmpegOpusAudio(stream_url, codec=codec, before_options=before_options, options=cls.FFMPEG_OPTIONS['options'])
+
+        return disnake.FFmpegOpusAudio(stream_url, before_options=before_options, options=f'{cls.FFMPEG_OPTIONS["options"]} -af volume={volume:g}')
 
     @classmethod
-    async def create_source(cls, ctx: commands.Context, search: str, *, loop: asyncio.BaseEventLoop):
-        loop = loop or asyncio.get_event_loop()
+    def trim_info(cls, data: dict) -> dict:
+        info = {field: data[field] for field in cls.METADATA_FIELDS if data.get(field) is not None}
+
+        # Flat search results only carry the video ID, so build the page URL from it.
+        if 'webpage_url' not in info:
+            if data.get('ie_key') == 'Youtube':
+                info['webpage_url'] = f'https://www.youtube.com/watch?v={data["id"]}'
+            else:
+                info['webpage_url'] = data['url']
 
-        partial = functools.partial(cls.ytdl.extract_info, search, download=False, process=False)
-        data = await loop.run_in_executor(None, partial)
+        return info
+
+    @classmethod
+    def extract_metadata(cls, search: str) -> dict:
+        data = cls.ytdl.extract_info(search, download=False, process=False)
+
+        while data is not None:
+            if 'entries' in data:
+                data = next((entry for entry in data['entries'] if entry), None)
+            elif data.get('_type') == 'url' and not data.get('title'):
+                data = cls.ytdl.extract_info(data['url'], download=False, process=False)
+            else:
+                break
 
         if data is None:
             raise YTDLError(f'Couldn\'t find anything that matches **{search}**')
 
-        if 'entries' not in data:
-            process_info = data
-        else:
-            process_info = None
-            for entry in data['entries']:
-                if entry:
-                    process_info = entry
-                    break
-
-            if process_info is None:
-                raise YTDLError(f'Couldn\'t find anything that matches **{search}**')
+        return cls.trim_info(data)
 
-        webpage_url = process_info['webpage_url']
-        partial = functools.partial(cls.ytdl.extract_info, webpage_url, download=False)
-        processed_info = await loop.run_in_executor(None, partial)
+    @classmethod
+    def extract_stream(cls, webpage_url: str) -> dict:
+        processed_info = cls.ytdl.extract_info(webpage_url, download=False)
 
         if processed_info is None:
             raise YTDLError(f'Couldn\'t fetch **{webpage_url}**')
@@ -1857,7 +3223,36 @@ class YTDLSource(disnake.PCMVolumeTransformer):
                 except IndexError:
                     raise YTDLError(f'Couldn\'t retrieve any matches for **{webpage_url}**')
 
-        return cls(ctx, disnake.FFmpegPCMAudio(info['url'], **cls.FFMPEG_OPTIONS), data=info)
+        resolved_at = time.time()
+        expires_at = resolved_at + STREAM_URL_TTL
+
+        # Signed stream URLs carry their own expiry, which is usually the tighter bound.
+        if expire := urllib.parse.parse_qs(urllib.parse.urlparse(info['url']).query).get('expire'):
+            expires_at = min(expires_at, float(expire[0]))
+
+        return cls.trim_info(info) | {'url': info['url'], 'resolved_at': resolved_at, 'expires_at': expires_at}
+
+    # Both lookups go through a cache first: searches map to page metadata for a long time, while stream
+    # URLs are only kept for a fraction of their lifetime. Callers get copies, since songs mutate theirs.
+    @classmethod
+    async def search_source(cls, search: str, *, guild_id: int, patience: float = 0.0) -> dict:
+        key = ' '.join(search.split())
+
+        if (info := search_cache.get(key)) is None:
+            info = await extraction_pool.run(guild_id, cls.extract_metadata, search, patience=patience)
+            search_cache.put(key, info)
+
+        return dict(info)
+
+    @classmethod
+    async def resolve_source(cls, webpage_url: str, *, guild_id: int, bounded: bool = True) -> dict:
+        info = stream_cache.get(webpage_url)
+
+        if info is None or info.get('expires_at', 0) - time.time() < STREAM_EXPIRY_MARGIN:
+            info = await extraction_pool.run(guild_id, cls.extract_stream, webpage_url, bounded=bounded)
+            stream_cache.put(webpage_url, info, info['resolved_at'])
+
+        return dict(info)
 
     @staticmethod
     def parse_duration(duration: int) -> str:
@@ -1878,28 +3273,165 @@ class YTDLSource(disnake.PCMVolumeTransformer):
         return ', '.join(duration)
 
 
+# Audio source that can read its first frames ahead of time, so the ffmpeg spawn and connect happen before playback.
+# When looping, it can also record what it plays for the song's loop cache.
+class PrebufferedAudio(disnake.AudioSource):
+    def __init__(self, source: disnake.AudioSource, recording: 'LoopRecording | None' = None):
+        self.source = source
+        self.recording = recording
+        self.frames: collections.deque[bytes] = collections.deque()
+
+        self.released = False
+        voice_governor.processes += 1
+        voice_governor.spawned += 1
+        voice_governor.audios.add(self)
+
+    def prebuffer(self, frames: int) -> None:
+        for _ in range(frames):
+            frame = self.source.read()
+            if not frame:
+                break
+
+            self.frames.append(frame)
+
+    def read(self) -> bytes:
+        frame = self.frames.popleft() if self.frames else self.source.read()
+        voice_governor.bytes_streamed += len(frame)
+
+        if self.recording is not None:
+            self.recording.add(frame)
+
+        return frame
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self) -> None:
+        self.frames.clear()
+        self.source.cleanup()
+
+        if not self.released:
+            self.released = True
+            voice_governor.processes -= 1
+
+
+# Opus-encoded copy of a full play of a song, kept on the song so later loop iterations skip the network and ffmpeg.
+# Recording is abandoned once it passes the size limit, so long tracks keep streaming instead.
+class LoopRecording:
+    def __init__(self, song: 'Song', max_bytes: int, *, encode: bool):
+        self.song = song
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self._encoder = disnake.opus.Encoder() if encode else None
+        self._frames: List[bytes] | None = []
+
+    @property
+    def active(self) -> bool:
+        return self._frames is not None
+
+    def add(self, frame: bytes) -> None:
+        if self._frames is None:
+            return
+
+        if not frame:
+            self.song.loop_cache = tuple(self._frames)
+            self._frames = None
+            return
+
+        # The last frame of a stream can come up short, and the encoder only takes whole frames.
+        if self._encoder is not None:
+            packet = self._encoder.encode(frame.ljust(disnake.opus.Encoder.FRAME_SIZE, b'\0'), disnake.opus.Encoder.SAMPLES_PER_FRAME)
+        else:
+            packet = frame
+
+        self.size += len(packet)
+
+        if self.size > self.max_bytes:
+            self._frames = None
+        else:
+            self._frames.append(packet)
+
+
+class CachedOpusAudio(disnake.AudioSource):
+    def __init__(self, packets: Tuple[bytes, ...], *, decode: bool):
+        self.packets = iter(packets)
+        self._decoder = disnake.opus.Decoder() if decode else None
+
+    def prebuffer(self, frames: int) -> None:
+        pass
+
+    def is_opus(self) -> bool:
+        return self._decoder is None
+
+    def read(self) -> bytes:
+        packet = next(self.packets, None)
+
+        if packet is None:
+            return b''
+
+        return self._decoder.decode(packet) if self._decoder is not None else packet
+
+
+# Created after YTDLSource, so forked extraction workers inherit it, and before any threads are started.
+extraction_pool = ExtractionPool(YTDL_WORKERS, YTDL_MAX_PENDING, YTDL_EXECUTOR)
+
+track_gaps = LatencyHistogram((0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+prebuffer_stats: Dict[str, int] = {
+    'prebuffered': 0,
+    'cold_starts': 0
+}
+
+
 # Base class for interacting with the Spotify API.
 class Spotify:
     @classmethod
-    def get_track_id(self, track: Any):
-        track = sp.track(track)
-        return track["id"]
+    async def stream_track_ids(self, first_page: Callable[[], dict], extract: Callable[[dict], str | None], *, loop: asyncio.BaseEventLoop):
+        pages: asyncio.Queue = asyncio.Queue(maxsize=SPOTIFY_PREFETCH_PAGES)
 
-    @classmethod
-    def get_playlist_track_ids(self, playlist_id: Any):
-        ids = []
-        playlist = sp.playlist(playlist_id)
+        # Pages are fetched in the background while earlier ones are being enqueued, at most
+        # SPOTIFY_PREFETCH_PAGES ahead of the consumer.
+        async def prefetch():
+            try:
+                page = await loop.run_in_executor(None, first_page)
 
-        for item in playlist['tracks']['items']:
-            track = item['track']
-            ids.append(track['id'])
+                while page:
+                    await pages.put([extract(item) for item in page['items']])
+                    page = await loop.run_in_executor(None, sp.next, page) if page['next'] else None
 
-        return ids
+            except Exception as e:
+                await pages.put(e)
+
+            else:
+                await pages.put(None)
+
+        prefetcher = loop.create_task(prefetch())
+
+        try:
+            while (ids := await pages.get()) is not None:
+                if isinstance(ids, Exception):
+                    raise ids
+
+                yield [id for id in ids if id]
+
+        finally:
+            prefetcher.cancel()
+
+    @classmethod
+    def stream_playlist_track_ids(self, playlist_id: Any, *, loop: asyncio.BaseEventLoop):
+        return self.stream_track_ids(
+            functools.partial(sp.playlist_items, playlist_id, additional_types=('track',)),
+            lambda item: item['track'] and item['track']['id'],
+            loop=loop
+        )
 
     @classmethod
-    def get_album(self, album_id: Any):
-        album = sp.album_tracks(album_id)
-        return [item["id"] for item in album['items']]
+    def stream_album_track_ids(self, album_id: Any, *, loop: asyncio.BaseEventLoop):
+        return self.stream_track_ids(
+            functools.partial(sp.album_tracks, album_id),
+            lambda item: item['id'],
+            loop=loop
+        )
 
     @classmethod
     def get_album_id(self, id: Any):
@@ -1907,11 +3439,117 @@ class Spotify:
 
     @classmethod
     def get_track_features(self, id: Any) -> str:
-        meta = sp.track(id)
+        return self.format_track_features(sp.track(id))
+
+    @classmethod
+    def get_tracks_features(self, ids: List[str]) -> List[str]:
+        return [self.format_track_features(meta) for meta in sp.tracks(ids)['tracks'] if meta]
+
+    @staticmethod
+    def format_track_features(meta: dict) -> str:
         album = meta['album']['name']
         artist = meta['album']['artists'][0]['name']
         return f"{artist} - {album}"
 
+    @classmethod
+    async def resolve_tracks(self, ids: List[str], *, loop: asyncio.BaseEventLoop) -> List[str]:
+        ids = [id for id in ids if id]
+        batches = await asyncio.gather(
+            *(
+                loop.run_in_executor(None, self.get_tracks_features, ids[index:index + SPOTIFY_BATCH_SIZE])
+                for index in range(0, len(ids), SPOTIFY_BATCH_SIZE)
+            )
+        )
+        return [track for batch in batches for track in batch]
+
+
+# Producer / consumer pipeline for bulk imports (Spotify metadata -> YouTube search), with bounded concurrency
+# at every stage and songs enqueued in their original order as soon as they're found. Streams are resolved
+# later by the voice state's lookahead.
+class MusicImport:
+    def __init__(self, ctx: commands.Context, *, loop: asyncio.BaseEventLoop):
+        self.ctx = ctx
+        self.loop = loop
+        self.found = 0
+        self.queued = 0
+        self.failed = 0
+
+        self._search_slots = asyncio.Semaphore(IMPORT_SEARCH_CONCURRENCY)
+        self._last_progress = 0.0
+        self._task = None
+
+    async def _search(self, track: str) -> dict:
+        async with self._search_slots:
+            return await YTDLSource.search_source(track, guild_id=self.ctx.guild.id, patience=IMPORT_EXTRACTION_PATIENCE)
+
+    # Stops as soon as the voice state it's filling gets closed, keeping whatever was queued up to then.
+    async def run(self, pages, on_progress: Callable[['MusicImport'], Any]) -> None:
+        voice_state = self.ctx.voice_state
+        if voice_state.closed:
+            return
+
+        self._task = self.loop.create_task(self._import(pages, on_progress))
+        voice_state.imports.add(self)
+
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            if not voice_state.closed:
+                raise
+        finally:
+            voice_state.imports.discard(self)
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _import(self, pages, on_progress: Callable[['MusicImport'], Any]) -> None:
+        window: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_WINDOW)
+
+        async def produce():
+            try:
+                async for ids in pages:
+                    for track in await Spotify.resolve_tracks(ids, loop=self.loop):
+                        self.found += 1
+                        await window.put(self.loop.create_task(self._search(track)))
+
+            except Exception as e:
+                await window.put(e)
+
+            else:
+                await window.put(None)
+
+        producer = self.loop.create_task(produce())
+
+        try:
+            while (resolving := await window.get()) is not None:
+                if isinstance(resolving, Exception):
+                    raise resolving
+
+                # A search that found no room in the extraction pool even after waiting counts as failed too.
+                try:
+                    info = await resolving
+                except (YTDLError, youtube_dl.utils.DownloadError):
+                    self.failed += 1
+                else:
+                    if self.ctx.voice_state.closed:
+                        break
+
+                    await self.ctx.voice_state.enqueue(Song(self.ctx, info))
+                    self.queued += 1
+
+                if time.monotonic() - self._last_progress >= IMPORT_PROGRESS_INTERVAL:
+                    self._last_progress = time.monotonic()
+                    await on_progress(self)
+
+        finally:
+            producer.cancel()
+
+            while not window.empty():
+                resolving = window.get_nowait()
+                if isinstance(resolving, asyncio.Task):
+                    resolving.cancel()
+
 
 # Views (static / dynamic, for music commands).
 class NowCommandView(disnake.ui.View):
@@ -1989,6 +3627,7 @@ class QueueCommandView(disnake.ui.View):
     @disnake.ui.button(label='Shuffle', style=disnake.ButtonStyle.gray)
     async def shuffle(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
         self.ctx.voice_state.songs.shuffle()
+        self.ctx.voice_state.prefetch()
         button.label = 'Shuffled'
         button.disabled = True
 
@@ -2004,19 +3643,86 @@ class QueueCommandView(disnake.ui.View):
         await self.message.edit(view=self)
 
 
+song_ids = itertools.count(1)
+
 class Song:
-    __slots__ = ('source', 'requester')
+    __slots__ = ('id', 'track', 'requester', 'channel', 'source', 'stream_url', 'expires_at', 'loop_cache', 'resume_at', '_resolving')
 
-    def __init__(self, source: YTDLSource):
-        self.source = source
-        self.requester = source.requester
+    def __init__(self, ctx: commands.Context, info: dict):
+        self.id = next(song_ids)
+        self.track = TrackInfo.from_info(info)
+        self.requester = ctx.author
+        self.channel = ctx.channel
+
+        self.source = None
+        self.stream_url = None
+        self.expires_at = 0.0
+        self.loop_cache = None
+        self.resume_at = 0.0
+        self._resolving = None
+
+    # Rebuilds a song from its journal record. It stays unresolved until the player or the lookahead gets to it.
+    @classmethod
+    def restore(cls, ctx: commands.Context, record: dict) -> 'Song':
+        song = cls(ctx, record['track'])
+        song.requester = ctx.guild.get_member(record['requester']) or ctx.author
+        song.channel = ctx.guild.get_channel(record['channel']) or ctx.channel
+        song.resume_at = record.get('offset', 0.0)
+        return song
+
+    @property
+    def title(self) -> str:
+        return self.track.title
+
+    @property
+    def url(self) -> str:
+        return self.track.webpage_url
+
+    @property
+    def is_resolved(self) -> bool:
+        return self.stream_url is not None and self.expires_at - time.time() > STREAM_EXPIRY_MARGIN
+
+    @property
+    def is_playable(self) -> bool:
+        return self.loop_cache is not None or self.is_resolved
+
+    async def _resolve(self, bounded: bool):
+        info = await YTDLSource.resolve_source(self.url, guild_id=self.channel.guild.id, bounded=bounded)
+        self.stream_url = info.pop('url')
+        self.expires_at = info.pop('expires_at')
+        self.track = TrackInfo.from_info(info)
+
+    async def resolve(self, *, loop: asyncio.BaseEventLoop, bounded: bool = True):
+        if self.is_playable:
+            return
+
+        # The lookahead and the player may ask for the same song at once, so share one extraction.
+        if self._resolving is None or self._resolving.done():
+            self._resolving = loop.create_task(self._resolve(bounded))
+
+        await asyncio.shield(self._resolving)
+
+    def create_source(self, volume: float, *, record: bool = False, offset: float = 0.0) -> YTDLSource:
+        if self.loop_cache is not None:
+            packets = self.loop_cache[int(offset * 1000 / disnake.opus.Encoder.FRAME_LENGTH):]
+            audio = CachedOpusAudio(packets, decode=MUSIC_AUDIO_MODE != 'opus' or volume != 1.0)
+            return YTDLSource(self, audio, volume=volume, offset=offset)
+
+        audio = YTDLSource.create_audio(self.stream_url, codec=self.track.acodec, volume=volume, offset=offset)
+        recording = None
+
+        # Opus output only gets recorded at full volume, so the cached copy can be replayed at any volume later.
+        if record and (volume == 1.0 if audio.is_opus() else disnake.opus.is_loaded()):
+            recording = LoopRecording(self, LOOP_CACHE_MAX_BYTES, encode=not audio.is_opus())
+
+        return YTDLSource(self, PrebufferedAudio(audio, recording), volume=volume, offset=offset)
 
     def create_embed(self, ctx: commands.Context) -> Tuple[disnake.Embed, disnake.ui.View]:
-        duration = 'Live' if not self.source.duration else self.source.duration
+        duration = YTDLSource.parse_duration(self.track.duration) if self.track.duration else 'Live'
 
         embed = (
             disnake.Embed(
-                title=f'{self.source.title}',
+                title=f'{self.title}',
                 color=ACCENT_COLOR['PRIMARY']
             ).add_field(
                 name='Duration', 
@@ -2025,22 +3731,247 @@ class Song:
                 name='Requested by', 
                 value=self.requester.mention
             ).set_image(
-                url=self.source.thumbnail
+                url=self.track.thumbnail
             )
         )
-        view = NowCommandView(ctx=ctx, url=self.source.url)
+        view = NowCommandView(ctx=ctx, url=self.url)
         return embed, view
 
 
+# Array-backed song store. Songs are consumed by moving a head index, and removed by ID by leaving a tombstone,
+# so both are O(1). Dead slots get compacted away in one pass once they make up half of the array, or before
+# anything needs positional access.
+class SongStore:
+    def __init__(self):
+        self._items: List[Song | None] = []
+        self._head = 0
+        self._live = 0
+        self._tombstones = 0
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __bool__(self) -> bool:
+        return self._live > 0
+
+    def __iter__(self):
+        return (song for song in self._items[self._head:] if song is not None)
+
+    def __contains__(self, song_id: int) -> bool:
+        return song_id in self._positions
+
+    def _compact(self) -> None:
+        self._items = [song for song in self._items[self._head:] if song is not None]
+        self._head = 0
+        self._tombstones = 0
+        self._positions = {song.id: position for position, song in enumerate(self._items)}
+
+    def _maybe_compact(self) -> None:
+        if (self._head + self._tombstones) * 2 > len(self._items):
+            self._compact()
+
+    def get(self, index: int | slice) -> Song | List[Song]:
+        if self._tombstones:
+            self._compact()
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._live)
+            return self._items[self._head + start:self._head + stop:step]
+
+        if not -self._live <= index < self._live:
+            raise IndexError('song index out of range')
+
+        return self._items[self._head + index % self._live]
+
+    def append(self, song: Song) -> None:
+        self._positions[song.id] = len(self._items)
+        self._items.append(song)
+        self._live += 1
+
+    def popleft(self) -> Song:
+        while (song := self._items[self._head]) is None:
+            self._head += 1
+            self._tombstones -= 1
+
+        self._items[self._head] = None
+        self._head += 1
+        self._live -= 1
+        del self._positions[song.id]
+
+        self._maybe_compact()
+        return song
+
+    def remove(self, song_id: int) -> Song:
+        position = self._positions.pop(song_id)
+        song = self._items[position]
+
+        self._items[position] = None
+        self._live -= 1
+        self._tombstones += 1
+
+        self._maybe_compact()
+        return song
+
+    def shuffle(self) -> None:
+        self._compact()
+        random.shuffle(self._items)
+        self._positions = {song.id: position for position, song in enumerate(self._items)}
+
+    def clear(self) -> None:
+        self.__init__()
+
+
+# Append-only log of one guild's queue, so it can be picked up again after a restart. Every change appends a line,
+# and the file gets rewritten as a fresh snapshot once it has grown a few times past what it describes.
+class QueueJournal:
+    def __init__(self, path: str, snapshot: Callable[[], List[dict]]):
+        self.path = path
+        self.snapshot = snapshot
+
+        self._file = None
+        self._records = 0
+        self._limit = QUEUE_JOURNAL_COMPACT_MIN
+
+        self.compact()
+
+    @staticmethod
+    def path_for(guild_id: int) -> str:
+        return os.path.join(QUEUE_JOURNAL_DIR, f'{guild_id}.jsonl')
+
+    @staticmethod
+    def song_record(song: Song, offset: float = 0.0) -> dict:
+        record = {'op': 'add', 'id': song.id, 'requester': song.requester.id, 'channel': song.channel.id, 'track': song.track._asdict()}
+        if offset:
+            record['offset'] = round(offset, 2)
+
+        return record
+
+    # Replays a journal into the songs it describes, whatever was playing first with the offset it had reached.
+    @staticmethod
+    def load(path: str) -> Dict[str, Any] | None:
+        try:
+            with open(path) as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return None
+
+        entries: Dict[int, dict] = {}
+        current = None
+        offset = 0.0
+        settings = {'loop': False, 'volume': DEFAULT_VOLUME}
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # A write cut short by the restart, and nothing can come after it.
+
+            op = record['op']
+
+            if op == 'add':
+                entries[record['id']] = record
+            elif op == 'remove':
+                entries.pop(record['id'], None)
+            elif op == 'clear':
+                entries.clear()
+            elif op == 'shuffle':
+                entries = {song_id: entries[song_id] for song_id in record['order'] if song_id in entries}
+            elif op == 'play':
+                current = entries.pop(record['id'], current)
+                offset = record.get('offset', 0.0)
+            elif op == 'seek':
+                offset = record['offset']
+            elif op == 'done':
+                current = None
+            elif op == 'settings':
+                settings = {'loop': record['loop'], 'volume': record['volume']}
+
+        songs = list(entries.values())
+        if current is not None:
+            songs.insert(0, current | {'offset': offset})
+
+        return {**settings, 'songs': songs}
+
+    def record(self, op: str, **fields) -> None:
+        # Every record can be replayed twice harmlessly, so compacting first never loses the change being recorded.
+        if self._records >= self._limit:
+            self.compact()
+
+        if self._file is None:
+            return
+
+        try:
+            self._file.write(json.dumps({'op': op, **fields}) + '\n')
+            self._file.flush()
+        except OSError as e:
+            logging.warning(f'Stopped journaling {self.path}: {e}')
+            self.close()
+            return
+
+        self._records += 1
+        journal_stats['records'] += 1
+
+    def compact(self) -> None:
+        records = self.snapshot()
+        self.close()
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+            with open(f'{self.path}.tmp', 'w') as file:
+                file.writelines(json.dumps(record) + '\n' for record in records)
+
+            os.replace(f'{self.path}.tmp', self.path)
+            self._file = open(self.path, 'a')
+        except OSError as e:
+            logging.warning(f'Couldn\'t write queue journal {self.path}: {e}')
+            self._limit = math.inf
+            return
+
+        self._records = len(records)
+        self._limit = max(QUEUE_JOURNAL_COMPACT_MIN, len(records) * QUEUE_JOURNAL_COMPACT_RATIO)
+        journal_stats['compactions'] += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        self.close()
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+journal_stats: Dict[str, int] = {
+    'records': 0,
+    'compactions': 0,
+    'restored_songs': 0
+}
+
+# Keeps asyncio.Queue's awaitable get() by plugging the store in through the queue's storage hooks.
 class SongQueue(asyncio.Queue):
-    def __getitem__(self, item: Any):
-        if isinstance(item, slice):
-            return list(itertools.islice(self._queue, item.start, item.stop, item.step))
-        else:
-            return self._queue[item]
+    def _init(self, maxsize: int):
+        self._queue = SongStore()
+        self.journal: QueueJournal | None = None
+
+    def _put(self, song: Song):
+        self._queue.append(song)
+
+        if self.journal is not None:
+            self.journal.record(**QueueJournal.song_record(song))
+
+    def _get(self) -> Song:
+        return self._queue.popleft()
+
+    def __getitem__(self, item: int | slice):
+        return self._queue.get(item)
 
     def __iter__(self):
-        return self._queue.__iter__()
+        return iter(self._queue)
 
     def __len__(self):
         return self.qsize()
@@ -2048,11 +3979,22 @@ class SongQueue(asyncio.Queue):
     def clear(self):
         self._queue.clear()
 
+        if self.journal is not None:
+            self.journal.record('clear')
+
     def shuffle(self):
-        random.shuffle(self._queue)
+        self._queue.shuffle()
+
+        if self.journal is not None:
+            self.journal.record('shuffle', order=[song.id for song in self])
+
+    def remove(self, song_id: int) -> Song:
+        song = self._queue.remove(song_id)
 
-    def remove(self, index: int):
-        del self._queue[index]
+        if self.journal is not None:
+            self.journal.record('remove', id=song_id)
+
+        return song
 
     def get_queue_embed(self, ctx: commands.Context, page: int=1) -> disnake.Embed:
         items_per_page = 10
@@ -2062,7 +4004,7 @@ class SongQueue(asyncio.Queue):
         end = start + items_per_page
 
         queue_str = ''.join(
-            '`{0}.` [**{1.source.title}**]({1.source.url})\n'.format(i + 1, song)
+            '`{0}.` [**{1.title}**]({1.url})\n'.format(i + 1, song)
             for i, song in enumerate(ctx.voice_state.songs[start:end], start=start)
         )
 
@@ -2076,25 +4018,228 @@ class SongQueue(asyncio.Queue):
         return embed
 
 
+# Caps concurrent voice sessions (and with them ffmpeg processes) across guilds. New sessions past the cap wait
+# for a slot, idle sessions get reclaimed early under pressure, and optional spawns like prebuffering back off.
+class VoiceGovernor:
+    def __init__(self, max_sessions: int, max_processes: int):
+        # Every admitted session must always be able to run one ffmpeg process.
+        self.max_sessions = min(max_sessions, max_processes)
+        self.max_processes = max_processes
+
+        self.processes = 0
+        self.spawned = 0
+        self.bytes_streamed = 0
+        self.queued = 0
+        self.rejected = 0
+        self.reclaimed = 0
+        self.last_audit: Dict[str, Any] = {}
+
+        # Everything ever handed out, held weakly so the audit can spot what outlived its session.
+        self.states: weakref.WeakSet['VoiceState'] = weakref.WeakSet()
+        self.audios: weakref.WeakSet[PrebufferedAudio] = weakref.WeakSet()
+        self._suspects: weakref.WeakSet[PrebufferedAudio] = weakref.WeakSet()
+        self._unclaimed: set[int] = set()
+
+        self._sessions: Dict[int, 'VoiceState | None'] = {}
+        self._waiters: collections.deque[Tuple[int, asyncio.Future]] = collections.deque()
+
+    @property
+    def under_pressure(self) -> bool:
+        return len(self._sessions) >= self.max_sessions * VOICE_PRESSURE_RATIO
+
+    def idle_timeout(self) -> float:
+        return VOICE_PRESSURE_IDLE_TIMEOUT if self.under_pressure else VOICE_IDLE_TIMEOUT
+
+    def can_spawn(self) -> bool:
+        return self.processes < self.max_processes
+
+    def reclaim_idle(self) -> bool:
+        now = time.monotonic()
+        idle = [
+            state for state in self._sessions.values()
+            if state is not None and state.idle_since is not None and now - state.idle_since >= VOICE_MIN_IDLE
+        ]
+
+        if not idle:
+            return False
+
+        state = min(idle, key=lambda state: state.idle_since)
+        state.bot.loop.create_task(state.close())
+
+        self.reclaimed += 1
+        return True
+
+    async def admit(self, guild_id: int) -> None:
+        if guild_id in self._sessions:
+            return
+
+        if len(self._sessions) < self.max_sessions:
+            self._sessions[guild_id] = None
+            return
+
+        # Reclaiming an idle session releases its slot, which is handed to the first waiter in line.
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((guild_id, waiter))
+        self.reclaim_idle()
+
+        try:
+            await asyncio.wait_for(waiter, VOICE_ADMISSION_TIMEOUT)
+
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise VoiceCapacityError('I\'m playing music in too many servers right now. Try again in a bit!')
+
+        finally:
+            if (guild_id, waiter) in self._waiters:
+                self._waiters.remove((guild_id, waiter))
+
+    def register(self, guild_id: int, state: 'VoiceState') -> None:
+        self._sessions[guild_id] = state
+        self.states.add(state)
+
+    def release(self, guild_id: int, state: 'VoiceState | None' = None) -> None:
+        if guild_id not in self._sessions or self._sessions[guild_id] is not state:
+            return
+
+        del self._sessions[guild_id]
+
+        while self._waiters:
+            waiting_guild_id, waiter = self._waiters.popleft()
+
+            if waiter.done():
+                continue
+
+            waiter.set_result(None)
+
+            # A guild that already got a slot through an earlier waiter shares it, and the freed one goes further down the line.
+            if waiting_guild_id not in self._sessions:
+                self._sessions[waiting_guild_id] = None
+                break
+
+    # Closes states that died or fell out of the registry, and kills ffmpeg processes no live session owns.
+    # A process has to turn up unowned in two audits in a row, since one may be mid-prebuffer right now.
+    def audit(self, registry: Dict[int, 'VoiceState']) -> Dict[str, Any]:
+        live = set(registry.values())
+        orphaned_states = [state for state in self.states if state not in live and not state.closed]
+        dead_states = [state for state in live if state.closed or state.audio_player.done()]
+
+        owned = set()
+        for state in live:
+            if state.current is not None and state.current.source is not None:
+                owned.add(state.current.source.audio)
+            if state._prepared is not None:
+                owned.add(state._prepared[1].audio)
+
+        unowned = {audio for audio in self.audios if not audio.released and audio not in owned}
+        orphaned_audios = [audio for audio in unowned if audio in self._suspects]
+        self._suspects = weakref.WeakSet(unowned.difference(orphaned_audios))
+
+        for state in orphaned_states + dead_states:
+            if not state.closed:
+                state.bot.loop.create_task(state.close())
+            elif registry.get(state.guild_id) is state:
+                del registry[state.guild_id]
+
+        for audio in orphaned_audios:
+            audio.cleanup()
+
+        stale_sessions = [(guild_id, state) for guild_id, state in self._sessions.items() if state is not None and state.closed]
+
+        # Slots granted to a command that never registered a state, e.g. because it was cancelled right after.
+        # Like processes, a slot has to turn up unclaimed twice, since its command may just not have resumed yet.
+        unclaimed = {guild_id for guild_id, state in self._sessions.items() if state is None and guild_id not in registry}
+        stale_sessions.extend((guild_id, None) for guild_id in unclaimed & self._unclaimed)
+        self._unclaimed = unclaimed - self._unclaimed
+
+        for guild_id, state in stale_sessions:
+            self.release(guild_id, state)
+
+        self.last_audit = {
+            'at': datetime.datetime.now().strftime(DATETIME_FORMAT_STR),
+            'states_alive': len(self.states),
+            'orphaned_states': len(orphaned_states),
+            'dead_states': len(dead_states),
+            'orphaned_processes': len(orphaned_audios),
+            'stale_sessions': len(stale_sessions)
+        }
+        return self.last_audit
+
+    def stats(self) -> Dict[str, Any]:
+        states = [state for state in self._sessions.values() if state is not None]
+
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'idle_sessions': sum(state.idle_since is not None for state in states),
+            'waiting': len(self._waiters),
+            'processes': self.processes,
+            'max_processes': self.max_processes,
+            'spawned': self.spawned,
+            'bytes_streamed': self.bytes_streamed,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'reclaimed': self.reclaimed,
+            'last_audit': self.last_audit
+        }
+
+
+voice_governor = VoiceGovernor(MAX_VOICE_SESSIONS, MAX_FFMPEG_PROCESSES)
+
+
+# Stands in for a session when a guild has none, so read-only commands see an empty player without taking a slot.
+class IdleVoiceState:
+    def __init__(self):
+        self.voice = None
+        self.current = None
+        self.journal = None
+        self.exists = False
+        self.loop = False
+        self.volume = DEFAULT_VOLUME
+        self.is_playing = False
+        self.skip_votes = set()
+        self.songs = SongQueue()
+
+
 class VoiceState:
-    def __init__(self, bot: commands.AutoShardedBot, ctx: commands.Context):
+    def __init__(self, bot: commands.AutoShardedBot, ctx: commands.Context, on_close: Callable[['VoiceState'], None]):
         self.bot = bot
         self._ctx = ctx
+        self.guild_id = ctx.guild.id
+        self._on_close = on_close
 
         self.current = None
+        self.now = None
         self.voice = None
         self.exists = True
+        self.closed = False
         self.next = asyncio.Event()
         self.songs = SongQueue()
 
         self._loop = False
-        self._volume = 0.5
+        self._volume = DEFAULT_VOLUME
         self.skip_votes = set()
+        self._prefetcher = None
+
+        self._prebuffering = None
+        self._preparing = False
+        self._prepared = None
+        self._ended_at = None
+        self.idle_since = time.monotonic()
+
+        self.journal = None
+        self._checkpointed = None
+        self.imports: set[MusicImport] = set()
 
         self.audio_player = bot.loop.create_task(self.audio_player_task())
+        self.audio_player.add_done_callback(self._audio_player_done)
+
+    def _audio_player_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f'Audio player of guild {self.guild_id} crashed: {task.exception()}')
 
-    def __del__(self):
-        self.audio_player.cancel()
+        if not self.closed:
+            self.bot.loop.create_task(self.close())
 
     @property
     def loop(self):
@@ -2103,6 +4248,7 @@ class VoiceState:
     @loop.setter
     def loop(self, value: bool):
         self._loop = value
+        self._record('settings', loop=self._loop, volume=self._volume)
 
     @property
     def volume(self):
@@ -2111,74 +4257,347 @@ class VoiceState:
     @volume.setter
     def volume(self, value: float):
         self._volume = value
+        self._record('settings', loop=self._loop, volume=self._volume)
+
+    async def set_volume(self, value: float):
+        self.volume = value
+        source = self.current.source if self.current else None
+
+        if source is None or not source.is_opus():
+            if source is not None:
+                source.volume = value
+            return
+
+        # Once the song has finished, the next one will simply start at the new volume.
+        if not self.voice.is_playing() and not self.voice.is_paused():
+            return
+
+        # Opus has its volume baked in by ffmpeg, so restart the stream from where it is at the new volume.
+        await self.current.resolve(loop=self.bot.loop, bounded=False)
+
+        if self.current is None or self.current.source is not source or not (self.voice.is_playing() or self.voice.is_paused()):
+            return
+
+        replacement = self.current.create_source(value, offset=source.position)
+
+        self.current.source = self.now = replacement
+        self.voice.source = replacement
+
+        # The audio thread may still be partway through reading a frame from the old stream.
+        self.bot.loop.call_later(1, source.cleanup)
+
+        # The prebuffer waits on the old stream's position, which stops moving now, so follow the new one instead.
+        if self._prebuffering is not None:
+            self._prebuffering.cancel()
+        self._prebuffering = self.bot.loop.create_task(self.prebuffer_next(replacement))
 
     @property
     def is_playing(self):
         return self.voice and self.current
 
+    def _record(self, op: str, **fields):
+        if self.journal is not None:
+            self.journal.record(op, **fields)
+
+    # Picks up the queue this guild had before a restart, once it's connected again. Returns how many songs came back.
+    async def restore(self, ctx: commands.Context) -> int:
+        if not QUEUE_JOURNAL_DIR or self.journal is not None:
+            return 0
+
+        path = QueueJournal.path_for(self.guild_id)
+        saved = await self.bot.loop.run_in_executor(None, QueueJournal.load, path)
+
+        if self.closed or self.journal is not None:
+            return 0
+
+        restored = 0
+        if saved and saved['songs'] and self.current is None and not len(self.songs):
+            self._loop = saved['loop']
+            self._volume = saved['volume']
+
+            for record in saved['songs']:
+                self.songs.put_nowait(Song.restore(ctx, record))
+
+            restored = len(saved['songs'])
+            journal_stats['restored_songs'] += restored
+
+        self.journal = self.songs.journal = QueueJournal(path, self.snapshot_records)
+        return restored
+
+    def snapshot_records(self) -> List[dict]:
+        records = [{'op': 'settings', 'loop': self._loop, 'volume': self._volume}]
+
+        if self.current is not None:
+            offset = round(self.now.position if self.now is not None else self.current.resume_at, 2)
+            records.append(QueueJournal.song_record(self.current))
+            records.append({'op': 'play', 'id': self.current.id, 'offset': offset})
+
+        records.extend(QueueJournal.song_record(song, song.resume_at) for song in self.songs)
+        return records
+
+    def checkpoint(self):
+        if self.now is None:
+            return
+
+        offset = round(self.now.position, 2)
+        if offset != self._checkpointed:
+            self._checkpointed = offset
+            self._record('seek', offset=offset)
+
+    async def enqueue(self, song: Song):
+        await self.songs.put(song)
+        self.prefetch()
+
+    def prefetch(self):
+        if self._prefetcher is None or self._prefetcher.done():
+            self._prefetcher = self.bot.loop.create_task(self.resolve_upcoming())
+
+    async def resolve_upcoming(self):
+        attempted = set()
+
+        while upcoming := [song for song in self.songs[:STREAM_LOOKAHEAD] if song not in attempted and not song.is_resolved]:
+            for song in upcoming:
+                attempted.add(song)
+
+                try:
+                    await song.resolve(loop=self.bot.loop)
+                except (YTDLError, youtube_dl.utils.DownloadError):
+                    pass  # Reported by the player once the song comes up.
+
+    # Spawns and primes the next track's source a few seconds before the current one runs out.
+    async def prebuffer_next(self, source: YTDLSource):
+        duration = self.current.track.duration
+        if not duration:
+            return
+
+        while (remaining := duration - source.position) > PREBUFFER_LEAD:
+            await asyncio.sleep(remaining - PREBUFFER_LEAD)
+
+        # A loop that's still being recorded repeats from memory once this play ends, which needs no prebuffering.
+        if self.loop and source.is_recording:
+            return
+
+        song = self.current if self.loop else (self.songs[0] if len(self.songs) else None)
+        if song is None or not voice_governor.can_spawn():
+            return
+
+        self._preparing = True
+
+        try:
+            await song.resolve(loop=self.bot.loop, bounded=False)
+            prepared = song.create_source(self._volume, record=self.loop)
+
+            try:
+                await self.bot.loop.run_in_executor(None, prepared.prebuffer, PREBUFFER_FRAMES)
+            except BaseException:
+                prepared.cleanup()
+                raise
+
+            self._prepared = (song, prepared)
+
+        except (YTDLError, youtube_dl.utils.DownloadError):
+            pass  # Reported by the player once the song comes up.
+
+        finally:
+            self._preparing = False
+
+    async def finish_prebuffering(self):
+        if self._prebuffering is None:
+            return
+
+        # A source that's already being prepared is still quicker than a cold start, so let it finish.
+        if self._preparing:
+            await asyncio.wait([self._prebuffering])
+        else:
+            self._prebuffering.cancel()
+
+        self._prebuffering = None
+
+    def take_prepared(self, song: Song) -> YTDLSource | None:
+        prepared, self._prepared = self._prepared, None
+
+        if prepared is None:
+            return None
+
+        prepared_song, source = prepared
+        if prepared_song is song and song.is_playable and (not source.is_opus() or source.volume == self._volume):
+            return source
+
+        source.cleanup()
+        return None
+
     async def audio_player_task(self):
         while True:
             self.next.clear()
             self.now = None
 
             if self.loop == False:
+                if self.current is not None:
+                    self.current.loop_cache = None
+
+                self.idle_since = time.monotonic()
+
                 try:
-                    async with timeout(180):
+                    async with timeout(voice_governor.idle_timeout()):
                         self.current = await self.songs.get()
                 except asyncio.TimeoutError:
-                    self.bot.loop.create_task(self.stop())
-                    self.exists = False
                     return
-                
-                self.current.source.volume = self._volume
-                self.voice.play(self.current.source, after=self.play_next_song)
 
-            elif self.loop:
-                self.now = disnake.FFmpegPCMAudio(self.current.source.stream_url, **YTDLSource.FFMPEG_OPTIONS)
-                self.voice.play(self.now, after=self.play_next_song)
+                self.idle_since = None
+                self.prefetch()
+
+            offset, self.current.resume_at = self.current.resume_at, 0.0
+            self._record('play', id=self.current.id, offset=offset)
+
+            source = self.take_prepared(self.current)
+
+            if source is not None:
+                prebuffer_stats['prebuffered'] += 1
+            else:
+                # Loops without a cached copy re-resolve as well, since the stream URL may have expired since the first play.
+                try:
+                    await self.current.resolve(loop=self.bot.loop, bounded=False)
+                except (YTDLError, youtube_dl.utils.DownloadError) as e:
+                    self.loop = False
+                    self._ended_at = None
+                    self._record('done')
+                    await self.current.channel.send(f'Couldn\'t play **{self.current.title}**: {e}')
+                    continue
+
+                # A song resumed partway through can't fill the loop cache, which has to start from the beginning.
+                source = self.current.create_source(self._volume, record=self.loop and not offset, offset=offset)
+                prebuffer_stats['cold_starts'] += 1
+
+            source.volume = self._volume
+            self.current.source = self.now = source
+            self.voice.play(source, after=self.play_next_song)
+
+            if self._ended_at is not None:
+                track_gaps.observe(time.perf_counter() - self._ended_at)
+                self._ended_at = None
+
+            self._prebuffering = self.bot.loop.create_task(self.prebuffer_next(source))
             
             await self.next.wait()
+            await self.finish_prebuffering()
+
+            if not self.loop:
+                self._record('done')
+
+            # Only count the gap when another track was ready to go, not time spent waiting for a request.
+            if not self.loop and not len(self.songs):
+                self._ended_at = None
 
     def play_next_song(self, error=None):
+        self._ended_at = time.perf_counter()
+        self.bot.loop.call_soon_threadsafe(self.next.set)
+
         if error:
             raise VoiceError(str(error))
 
-        self.next.set()
-
     def skip(self):
         self.skip_votes.clear()
 
         if self.is_playing:
             self.voice.stop()
 
-    async def stop(self):
+    # Tears the session down right away: out of the registry, tasks cancelled, ffmpeg killed, voice disconnected.
+    async def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.exists = False
+        self._on_close(self)
+        voice_governor.release(self.guild_id, self)
+
+        # Whatever's left in the journal is what gets restored next time, so stop recording before tearing down.
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = self.songs.journal = None
+
+        for task in (self.audio_player, self._prefetcher, self._prebuffering):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+
+        for music_import in list(self.imports):
+            music_import.cancel()
+
         self.songs.clear()
 
+        if self._prepared is not None:
+            self._prepared[1].cleanup()
+            self._prepared = None
+
         if self.voice:
+            self.voice.stop()
             await self.voice.disconnect()
             self.voice = None
 
+        self.current = None
+
 
 # Music commands.
 class Music(commands.Cog):
     def __init__(self, bot: commands.AutoShardedBot):
         self.bot = bot
-        self.voice_states = {}
+        self.voice_states: Dict[int, VoiceState] = {}
+
+        self.audit_voice_states.start()
+        self.checkpoint_voice_states.start()
 
-    def get_voice_state(self, ctx: commands.Context) -> VoiceState:
+    async def get_voice_state(self, ctx: commands.Context) -> VoiceState:
         state = self.voice_states.get(ctx.guild.id)
         if not state or not state.exists:
-            state = VoiceState(self.bot, ctx)
+            await voice_governor.admit(ctx.guild.id)
+
+            # Another command may have set up this guild's session while we waited for a slot.
+            state = self.voice_states.get(ctx.guild.id)
+            if state and state.exists:
+                return state
+
+            state = VoiceState(self.bot, ctx, on_close=self.forget_voice_state)
+            voice_governor.register(ctx.guild.id, state)
             self.voice_states[ctx.guild.id] = state
 
         return state
 
-    def cog_unload(self):
+    def forget_voice_state(self, state: VoiceState):
+        if self.voice_states.get(state.guild_id) is state:
+            del self.voice_states[state.guild_id]
+
+    @tasks.loop(seconds=VOICE_AUDIT_INTERVAL)
+    async def audit_voice_states(self):
+        report = voice_governor.audit(self.voice_states)
+
+        if report['orphaned_states'] or report['dead_states'] or report['orphaned_processes'] or report['stale_sessions']:
+            logging.warning(f'Voice audit cleaned up leftovers: {report}')
+
+    @tasks.loop(seconds=QUEUE_CHECKPOINT_INTERVAL)
+    async def checkpoint_voice_states(self):
         for state in self.voice_states.values():
-            self.bot.loop.create_task(state.stop())
+            state.checkpoint()
+
+    async def connect_voice_state(self, ctx: commands.Context, destination: disnake.VoiceChannel | disnake.StageChannel):
+        ctx.voice_state.voice = await destination.connect()
+
+        if restored := await ctx.voice_state.restore(ctx):
+            await ctx.send(f'Picked up where I left off, **{restored}** tracks are back in the queue.')
+
+    def cog_unload(self):
+        self.audit_voice_states.cancel()
+        self.checkpoint_voice_states.cancel()
+
+        for state in list(self.voice_states.values()):
+            self.bot.loop.create_task(state.close())
 
     async def cog_before_invoke(self, ctx: commands.Context):
-        ctx.voice_state = self.get_voice_state(ctx)
+        # Only commands that connect take up a voice slot. The rest just look at whatever this guild has going.
+        if ctx.command.qualified_name in VOICE_CONNECT_COMMANDS:
+            ctx.voice_state = await self.get_voice_state(ctx)
+        else:
+            state = self.voice_states.get(ctx.guild.id)
+            ctx.voice_state = state if state and state.exists else IdleVoiceState()
 
     @commands.command(
         name='join', 
@@ -2193,7 +4612,7 @@ class Music(commands.Cog):
             await ctx.voice_state.voice.move_to(destination)
             return await ctx.author.request_to_speak()
 
-        ctx.voice_state.voice = await destination.connect()
+        await self.connect_voice_state(ctx, destination)
         await ctx.message.add_reaction(REACTION_EMOJI)
 
     @commands.command(
@@ -2207,7 +4626,7 @@ class Music(commands.Cog):
         if ctx.voice_state.voice:
             return await ctx.voice_state.voice.move_to(destination)
 
-        ctx.voice_state.voice = await destination.connect()
+        await self.connect_voice_state(ctx, destination)
 
     @commands.command(
         name='leave', 
@@ -2221,8 +4640,11 @@ class Music(commands.Cog):
         if not ctx.author.voice:
             return await ctx.reply('You are not in the same voice channel as mine.')
 
-        await ctx.voice_state.stop()
-        del self.voice_states[ctx.guild.id]
+        # Leaving on request means the queue is done with, so don't bring it back next time.
+        if ctx.voice_state.journal is not None:
+            ctx.voice_state.journal.discard()
+
+        await ctx.voice_state.close()
         await ctx.message.add_reaction(REACTION_EMOJI)
 
     @commands.command(
@@ -2240,7 +4662,7 @@ class Music(commands.Cog):
             if not volume:
                 embed = (
                     disnake.Embed(
-                        title=f'Current Volume: {ctx.voice_state.current.source.volume * 100}%',
+                        title=f'Current Volume: {ctx.voice_state.volume * 100:g}%',
                         color=ACCENT_COLOR['PRIMARY']
                     ).set_footer(
                         text=generate_random_footer(),
@@ -2252,7 +4674,7 @@ class Music(commands.Cog):
             if not 0 < volume <= 200:
                 return await ctx.reply('Volume must be between 1 and 200 to execute the command.')
 
-            ctx.voice_state.current.source.volume = volume / 100
+            await ctx.voice_state.set_volume(volume / 100)
             await ctx.reply(f'Volume of the player is now set to **{volume}%**')
 
         else:
@@ -2394,7 +4816,7 @@ class Music(commands.Cog):
         if len(ctx.voice_state.songs) == 0:
             return await ctx.reply('The queue is empty, so nothing to be removed.')
 
-        ctx.voice_state.songs.remove(index - 1)
+        ctx.voice_state.songs.remove(ctx.voice_state.songs[index - 1].id)
         await ctx.message.add_reaction(REACTION_EMOJI)
 
     @commands.command(
@@ -2422,43 +4844,43 @@ class Music(commands.Cog):
             
         async def put_song_to_voice_state(ctx: commands.Context, search: str, send_embed: bool=True):
             try:
-                source = await YTDLSource.create_source(ctx, search, loop=self.bot.loop)
+                info = await YTDLSource.search_source(search, guild_id=ctx.guild.id)
+            except ExtractorBusy:
+                raise  # Shown by the error handler as a busy message rather than a lookup failure.
             except YTDLError as e:
                 await ctx.reply('An error occurred while processing this request: {}'.format(str(e)))
             else:
-                song = Song(source)
+                song = Song(ctx, info)
                 embed = (
                     disnake.Embed(
-                        title=f'Enqueued {song.source.title} from YouTube.',
+                        title=f'Enqueued {song.title} from YouTube.',
                         color=ACCENT_COLOR['PRIMARY']
                     ).set_footer(
                         text=generate_random_footer(),
                         icon_url=ctx.author.avatar
                     )
                 )
-                await ctx.voice_state.songs.put(song)
+                await ctx.voice_state.enqueue(song)
 
                 if send_embed:
-                    await ctx.reply(embed=embed, view=PlayCommandView(url=song.source.url))
+                    await ctx.reply(embed=embed, view=PlayCommandView(url=song.url))
+
+        async def show_import_progress(sent_embed: disnake.Message, music_import: MusicImport):
+            enqueueing_embed.description = f'{music_import.queued} of {music_import.found} tracks queued so far.'
+            await sent_embed.edit(embed=enqueueing_embed)
 
         async with ctx.typing():
             if "https://open.spotify.com/playlist/" in search or "spotify:playlist:" in search:
-                ids = Spotify.get_playlist_track_ids(search)
-                tracks = []
-
-                for i in range(len(ids)):
-                    track = Spotify.get_track_features(ids[i])
-                    tracks.append(track)
-
                 sent_embed = await ctx.reply(embed=enqueueing_embed)
 
-                for track in tracks:
-                    await put_song_to_voice_state(ctx, track, send_embed=False)
+                music_import = MusicImport(ctx, loop=self.bot.loop)
+                await music_import.run(Spotify.stream_playlist_track_ids(search, loop=self.bot.loop), functools.partial(show_import_progress, sent_embed))
 
                 embed = (
                     disnake.Embed(
-                        title=f'{len(tracks)} tracks have been queued!',
-                        description=f'You can view the queue of songs imported from the playlist by using the `{PREFIX}queue` command.',
+                        title=f'{music_import.queued} tracks have been queued!',
+                        description=f'You can view the queue of songs imported from the playlist by using the `{PREFIX}queue` command.'
+                        + (f' {music_import.failed} tracks couldn\'t be found on YouTube.' if music_import.failed else ''),
                         color=ACCENT_COLOR['PRIMARY']
                     ).set_footer(
                         text=generate_random_footer(),
@@ -2468,22 +4890,16 @@ class Music(commands.Cog):
                 await sent_embed.edit(embed=embed)
 
             elif "https://open.spotify.com/album/" in search or "spotify:album:" in search:
-                ids = Spotify.get_album(search)
-                tracks = []
-
-                for i in range(len(ids)):
-                    track = Spotify.get_track_features(ids[i])
-                    tracks.append(track)
-
                 sent_embed = await ctx.reply(embed=enqueueing_embed)
 
-                for track in tracks:
-                    await put_song_to_voice_state(ctx, track, send_embed=False)
+                music_import = MusicImport(ctx, loop=self.bot.loop)
+                await music_import.run(Spotify.stream_album_track_ids(search, loop=self.bot.loop), functools.partial(show_import_progress, sent_embed))
 
                 embed = (
                     disnake.Embed(
-                        title=f'{len(tracks)} tracks have been queued!',
-                        description=f'You can view the queue of song imported from the album by using the `{PREFIX}queue` command.',
+                        title=f'{music_import.queued} tracks have been queued!',
+                        description=f'You can view the queue of song imported from the album by using the `{PREFIX}queue` command.'
+                        + (f' {music_import.failed} tracks couldn\'t be found on YouTube.' if music_import.failed else ''),
                         color=ACCENT_COLOR['PRIMARY']
                     ).set_footer(
                         text=generate_random_footer(),
@@ -2493,8 +4909,7 @@ class Music(commands.Cog):
                 await sent_embed.edit(embed=embed)
 
             elif "https://open.spotify.com/track/" in search or "spotify:track:" in search:
-                id = Spotify.get_track_id(search)
-                track = Spotify.get_track_features(id)
+                track = await self.bot.loop.run_in_executor(None, Spotify.get_track_features, search)
                 await put_song_to_voice_state(ctx, track)
 
             else:
@@ -2507,21 +4922,23 @@ class Music(commands.Cog):
     async def _playrich(self, ctx: commands.Context):
         for activity in ctx.author.activities:
             if isinstance(activity, disnake.Spotify):
-                track = Spotify.get_track_features(activity.track_id)
+                track = await self.bot.loop.run_in_executor(None, Spotify.get_track_features, activity.track_id)
 
                 if not ctx.voice_state.voice:
                     await ctx.invoke(self._join)
 
                 async with ctx.typing():
                     try:
-                        source = await YTDLSource.create_source(ctx, track, loop=self.bot.loop)
+                        info = await YTDLSource.search_source(track, guild_id=ctx.guild.id)
+                    except ExtractorBusy:
+                        raise  # Shown by the error handler as a busy message rather than a lookup failure.
                     except YTDLError as e:
                         await ctx.reply('An error occurred while processing this request: {}'.format(str(e)))
                     else:
-                        song = Song(source)
+                        song = Song(ctx, info)
                         embed = (
                             disnake.Embed(
-                                title=f'Enqueued {song.source.title} from YouTube.',
+                                title=f'Enqueued {song.title} from YouTube.',
                                 color=activity.color
                             ).set_image(
                                 url=activity.album_cover_url
@@ -2530,8 +4947,8 @@ class Music(commands.Cog):
                                 icon_url=ctx.author.avatar
                             )
                         )
-                        await ctx.voice_state.songs.put(song)
-                        await ctx.reply(embed=embed, view=PlayCommandView(url=song.source.url))
+                        await ctx.voice_state.enqueue(song)
+                        await ctx.reply(embed=embed, view=PlayCommandView(url=song.url))
 
 
     @_join.before_invoke
@@ -2564,6 +4981,52 @@ class Developer(commands.Cog):
             file=disnake.File('bot.log', spoiler=True)
         )
 
+    @commands.command(
+        name='stats',
+        help='Shows the internal performance counters of the bot.'
+    )
+    @commands.check(is_developer)
+    async def stats(self, ctx: commands.Context):
+        await ctx.author.send(
+            content='Performance counters for session: `' + startup_data['str'] + '`',
+            file=generate_json_file('stats', collect_stats())
+        )
+
+    @commands.command(
+        name='benchmark',
+        help='Benchmarks a hot path of the bot against its previous implementation (`profanity`, `extract`, `audio`, `queue`).'
+    )
+    @commands.check(is_developer)
+    async def benchmark(self, ctx: commands.Context, subject: str):
+        if subject == 'profanity':
+            messages = await ctx.history(limit=500).flatten()
+            corpus = [message.content for message in messages if message.content]
+
+            if not corpus:
+                return await ctx.reply('There are no messages in this channel to benchmark with.')
+
+            results = await self.bot.loop.run_in_executor(None, benchmark_profanity, corpus)
+
+        elif subject == 'extract':
+            async with ctx.typing():
+                results = await benchmark_extraction(jobs=YTDL_WORKERS * 8, entries=20000)
+
+        elif subject == 'audio':
+            async with ctx.typing():
+                results = await self.bot.loop.run_in_executor(None, benchmark_audio, 4, 30)
+
+        elif subject == 'queue':
+            async with ctx.typing():
+                results = await self.bot.loop.run_in_executor(None, benchmark_queue, ctx, 200)
+
+        else:
+            return await ctx.reply(f'There\'s no benchmark for `{subject}`.')
+
+        await ctx.author.send(
+            content=f'Benchmark results for `{subject}`:',
+            file=generate_json_file(f'benchmark-{subject}', results)
+        )
+
     @commands.command(
         name='close', 
         help='Closes the connection to Discord.'